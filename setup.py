@@ -28,8 +28,6 @@ setup(
     'Intended Audience :: Information Technology',
     'Intended Audience :: Science/Research',
     'Natural Language :: English',
-    'Programming Language :: Python :: 3.6',
-    'Programming Language :: Python :: 3.7',
     'Programming Language :: Python :: 3.8',
     'Programming Language :: Python :: 3 :: Only',
     'Topic :: Multimedia',
@@ -56,7 +54,7 @@ setup(
   keywords='vpe machine learning artificial intelligence pandas numpy cv2',
   zip_safe=False,
   install_requires=required_packages,
-  python_requires='~=3.6',
+  python_requires='>=3.8',
   include_package_data=True,
   packages=find_packages(),
 )
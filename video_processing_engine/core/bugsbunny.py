@@ -9,10 +9,16 @@ from csv import QUOTE_MINIMAL, writer
 from pathlib import Path
 from typing import List, Optional, Union
 
-from video_processing_engine.core.capture.scoobydoo import live
-from video_processing_engine.core.detect.motion import track_motion
+from video_processing_engine.core.capture.scoobydoo import live, live_segments
+from video_processing_engine.core.detect.motion import (extract_motion,
+                                                        track_motion)
+from video_processing_engine.core.detect.pipeline import analyze
+from video_processing_engine.core.detect.timeline import (busiest_windows,
+                                                          timeline_path)
+from video_processing_engine.core.process.planner import TrimPlan
 from video_processing_engine.core.process.sylvester import compress_video
 from video_processing_engine.core.process.stats import ctc
+from video_processing_engine.core.process.stats import duration as drn
 from video_processing_engine.core.process.trim import (trim_by_factor,
                                                        trim_by_points,
                                                        trim_num_parts,
@@ -31,6 +37,28 @@ from video_processing_engine.utils.logs import log
 from video_processing_engine.utils.paths import downloads, reports
 from video_processing_engine.vars import dev
 
+# Order keys honoured only by the separate motion & face stages.
+SEPARATE_STAGE_KEYS = ('motion_stride', 'motion_analysis_fps',
+                       'motion_keyframes_only', 'motion_prescreen',
+                       'motion_workers', 'face_batch_size',
+                       'face_track_interval', 'face_blocks', 'face_workers',
+                       'face_cache', 'face_gate_threshold')
+
+
+def single_pass(json_data: dict) -> bool:
+  """Returns True if motion & face analyses can share a single pass.
+
+  The single pass only supports frame-wise motion detection with the
+  default detector settings, so orders tuning either of the stages or
+  sampling the activity timeline are run through the separate stages.
+  """
+  if json_data.get('motion_mode', 'frames') == 'intervals':
+    return False
+  if json_data.get('sampling_mode', 'random') == 'activity':
+    return False
+  return not any(json_data.get(key) is not None
+                 for key in SEPARATE_STAGE_KEYS)
+
 
 def trimming_callable(json_data: dict,
                       final_file: str,
@@ -53,23 +81,32 @@ def trimming_callable(json_data: dict,
   timestamp_format = json_data.get('timestamp_format', '%H:%M:%S')
   pt_start_time = json_data.get('point_start_time', 0)
   pt_end_time = json_data.get('point_end_time', 30)
+  accurate = json_data.get('trim_accurate', False)
+
+  # Clips are collected into a single plan & cut together in the end.
+  plan = TrimPlan(final_file, accurate,
+                  workers=json_data.get('trim_workers', 2))
 
   if trim_type == 'trim_by_factor':
     log.info('Trimming video by factor.')
-    trimmed = trim_by_factor(final_file, trim_factor, clip_length, last_clip)
+    trimmed = trim_by_factor(final_file, trim_factor, clip_length, last_clip,
+                             accurate)
   elif trim_type == 'trim_num_parts':
     log.info(f'Trimming video in {number_of_clips} parts.')
     trimmed = trim_num_parts(final_file, number_of_clips, equal_distribution,
-                             clip_length, random_start, random_sequence)
+                             clip_length, random_start, random_sequence,
+                             plan)
   elif trim_type == 'trim_sub_sample':
     log.info('Trimming portion of the video as per timestamp.')
     trimmed = trim_sub_sample(final_file, start_time, end_time,
                                   sample_start_time, sample_end_time,
-                                  timestamp_format)
+                                  timestamp_format, plan)
   elif trim_type == 'trim_by_points':
     log.info('Trimming video as per start & end time.')
     trimmed = trim_by_points(final_file, pt_start_time, pt_end_time,
-                             trim_factor)
+                             trim_factor, plan)
+
+  plan.execute(log)
 
   return trimmed
 
@@ -135,11 +172,22 @@ def spin(json_obj: str,
     timestamp = json_data.get('timestamp_format', '%H:%M:%S')
     sampling_rate = json_data['sampling_rate']
     motion = json_data.get('analyze_motion', False)
+    motion_mode = json_data.get('motion_mode', 'frames')
+    frame_source = json_data.get('frame_source', 'opencv')
+    background = json_data.get('motion_background', 'static')
+    regions = json_data.get('motion_regions', None)
+    exclusions = json_data.get('motion_exclusions', None)
+    prescreen = json_data.get('motion_prescreen', None)
+    prescreen_threshold = json_data.get('motion_prescreen_threshold', None)
+    sampling_mode = json_data.get('sampling_mode', 'random')
+    face_detector = json_data.get('face_detector', None)
     face = json_data.get('analyze_face', False)
     compress = json_data.get('perform_compression', True)
     trim = json_data.get('perform_trimming', True)
     trimpress = json_data.get('trim_compressed', True)
     db_order = json_data.get('order_pk', 0)
+    segment_length = json_data.get('segment_length', None)
+    camera_timezone = json_data.get('camera_timezone', 'UTC')
 
     log.info(f'Video processing engine started spinning for camera #{camera}')
 
@@ -157,8 +205,15 @@ def spin(json_obj: str,
 
     else:
       log.info(f'Recording from camera #{camera} for this order.')
-      org_file = live(bucket, order, run_date, start_time, end_time, address,
-                      username, password, port, timeout, timestamp, log)
+      if segment_length:
+        org_file = live_segments(bucket, order, run_date, start_time,
+                                 end_time, address, username, password, port,
+                                 timeout, timestamp, segment_length, log,
+                                 camera_timezone)
+      else:
+        org_file = live(bucket, order, run_date, start_time, end_time,
+                        address, username, password, port, timeout,
+                        timestamp, log)
 
     if org_file:
       cloned = rename_original_file(org_file, bucket, order)
@@ -171,8 +226,40 @@ def spin(json_obj: str,
       log.info('Commencing core processes, estimated time of completion is '
               f'{ctc(cloned, sampling_rate)}.')
 
-      if motion:
-        cloned = track_motion(cloned, log=log, debug_mode=False)
+      combined = motion and face and single_pass(json_data)
+
+      if combined:
+        # Both the analyses share a single decode & encode of the video.
+        cloned = analyze(cloned, motion=True, face=True,
+                         frame_source=frame_source, background=background,
+                         regions=regions, exclusions=exclusions,
+                         backend=face_detector, log=log)
+
+        if not cloned:
+          cloned = archived
+
+        log.info('Fixing up the symbolic link of the analyzed video.')
+        shutil.move(cloned, temp)
+        log.info('Symbolic link has been restored for the analyzed video.')
+        cloned = temp
+      elif motion:
+        if motion_mode == 'intervals':
+          cloned = extract_motion(
+              cloned, stride=json_data.get('motion_stride', 1),
+              analysis_fps=json_data.get('motion_analysis_fps', None),
+              keyframes_only=json_data.get('motion_keyframes_only', False),
+              frame_source=frame_source, background=background,
+              regions=regions, exclusions=exclusions,
+              prescreen_method=prescreen,
+              prescreen_threshold=prescreen_threshold,
+              workers=json_data.get('motion_workers', 1), log=log)
+        else:
+          cloned = track_motion(cloned, frame_source=frame_source,
+                                background=background, regions=regions,
+                                exclusions=exclusions,
+                                prescreen_method=prescreen,
+                                prescreen_threshold=prescreen_threshold,
+                                log=log, debug_mode=False)
 
         if not cloned:
           cloned = archived
@@ -184,14 +271,35 @@ def spin(json_obj: str,
       else:
         log.info('Skipping motion analysis.')
 
-      log.info(f'Randomly sampling {sampling_rate}% of the original video.')
-
-      temp = trim_sample_section(temp, sampling_rate)
+      activity, windows = timeline_path(temp), None
+      if sampling_mode == 'activity' and os.path.isfile(activity):
+        windows = busiest_windows(
+            activity, drn(archived) * float(sampling_rate) * 0.01)
+      if windows:
+        log.info(f'Sampling busiest {sampling_rate}% of the original video.')
+        # Timeline maps to the original video & not the motion clips, so
+        # the window is cut from the backup into the uploaded video.
+        temp = trim_sample_section(temp, sampling_rate, windows[0][:2],
+                                   source=archived)
+      else:
+        log.info(f'Randomly sampling {sampling_rate}% of the original '
+                 'video.')
+        temp = trim_sample_section(temp, sampling_rate)
       junk.append(temp)
 
-      if face:
+      if face and not combined:
         temp = cloned
-        cloned = redact_faces(cloned, log=log, debug_mode=False)
+        cloned = redact_faces(cloned, frame_source=frame_source,
+                              backend=face_detector,
+                              batch_size=json_data.get('face_batch_size', 1),
+                              track_interval=json_data.get(
+                                  'face_track_interval', 1),
+                              blocks=json_data.get('face_blocks', 7),
+                              workers=json_data.get('face_workers', 1),
+                              use_cache=json_data.get('face_cache', False),
+                              gate_threshold=json_data.get(
+                                  'face_gate_threshold', None),
+                              log=log, debug_mode=False)
 
         if not cloned:
           cloned = archived
@@ -200,7 +308,7 @@ def spin(json_obj: str,
         shutil.move(cloned, temp)
         log.info('Symbolic link has been restored for the redacted video.')
         cloned = temp
-      else:
+      elif not face:
         log.info('Skipping face redaction.')
 
       if not trim:
@@ -297,6 +405,8 @@ def phase_one(json_obj: str,
     trim = json_data.get('perform_trimming', True)
     trimpress = json_data.get('trim_compressed', True)
     db_order = json_data.get('order_pk', 0)
+    segment_length = json_data.get('segment_length', None)
+    camera_timezone = json_data.get('camera_timezone', 'UTC')
 
     log.info(f'Video processing engine started spinning for camera #{camera}')
 
@@ -314,8 +424,15 @@ def phase_one(json_obj: str,
 
     else:
       log.info(f'Recording from camera #{camera} for this order.')
-      org_file = live(bucket, order, run_date, start_time, end_time, address,
-                      username, password, port, timeout, timestamp, log)
+      if segment_length:
+        org_file = live_segments(bucket, order, run_date, start_time,
+                                 end_time, address, username, password, port,
+                                 timeout, timestamp, segment_length, log,
+                                 camera_timezone)
+      else:
+        org_file = live(bucket, order, run_date, start_time, end_time,
+                        address, username, password, port, timeout,
+                        timestamp, log)
 
     # if org_file:
     #   cloned = rename_original_file(org_file, bucket, order)
@@ -0,0 +1,205 @@
+"""A subservice for tracking liveness of the cameras."""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from video_processing_engine.utils.logs import log as _log
+
+
+class Endpoint(object):
+  """Cached liveness state of a single camera endpoint."""
+
+  def __init__(self, host: str, port: int) -> None:
+    super(Endpoint, self).__init__()
+    self.host = host
+    self.port = port
+    self.up = None
+    self.reported = None
+    self.checked_at = 0.0
+    self.failures = 0
+    self.next_probe = 0.0
+    self.event = asyncio.Event()
+    self.probing: Optional[asyncio.Future] = None
+
+  def due(self, current: float) -> bool:
+    """Returns True if the endpoint needs to be probed again."""
+    return current >= self.next_probe
+
+
+class LivenessProber(object):
+  """Probes all the camera endpoints concurrently & caches the results.
+
+  Every probe round opens asynchronous TCP connections to all endpoints
+  which are due, so a whole site costs one round bounded by a single
+  timeout. Concurrent probes of an endpoint share a single connection
+  attempt. Results are cached for `ttl` secs. Dead cameras are probed
+  again after an exponential backoff with jitter & waiting recorders
+  are woken up as soon as their camera comes back.
+
+  Args:
+    ttl: Time (default: 30 secs) for which a live camera is trusted.
+    timeout: Maximum time (default: 5 secs) to wait for a connection.
+    base_backoff: Initial delay (default: 5 secs) for a dead camera.
+    max_backoff: Maximum delay (default: 300 secs) for a dead camera.
+    log: Logger object.
+  """
+
+  def __init__(self,
+               ttl: float = 30.0,
+               timeout: float = 5.0,
+               base_backoff: float = 5.0,
+               max_backoff: float = 300.0,
+               log: logging.Logger = None) -> None:
+    super(LivenessProber, self).__init__()
+    self.ttl = ttl
+    self.timeout = timeout
+    self.base_backoff = base_backoff
+    self.max_backoff = max_backoff
+    self.log = _log(__file__) if log is None else log
+    self.endpoints: Dict[Tuple[str, int], Endpoint] = {}
+    self._listeners: List[Callable[[Endpoint], None]] = []
+    self._wakeup = None
+
+  def register(self, host: str, port: int = 554) -> Endpoint:
+    """Add camera endpoint to the prober if it's not known yet."""
+    key = (host, int(port))
+    if key not in self.endpoints:
+      self.endpoints[key] = Endpoint(host, int(port))
+      if self._wakeup is not None:
+        self._wakeup.set()
+    return self.endpoints[key]
+
+  def subscribe(self, callback: Callable[[Endpoint], None]) -> None:
+    """Call the callback whenever a camera goes up or down."""
+    self._listeners.append(callback)
+
+  def is_up(self, host: str, port: int = 554) -> Optional[bool]:
+    """Returns cached state of the camera, None if it's unknown."""
+    endpoint = self.endpoints.get((host, int(port)))
+    if endpoint is None or endpoint.up is None:
+      return None
+    if endpoint.up and time.time() - endpoint.checked_at > self.ttl:
+      return None
+    return endpoint.up
+
+  def invalidate(self, host: str, port: int = 554) -> None:
+    """Forget the cached state & probe the camera in the next round."""
+    endpoint = self.register(host, port)
+    endpoint.up = None
+    endpoint.next_probe = 0.0
+    endpoint.event.clear()
+    if self._wakeup is not None:
+      self._wakeup.set()
+
+  async def probe(self, endpoint: Endpoint) -> bool:
+    """Probe single endpoint & update it's cached state.
+
+    Callers arriving while the endpoint is being probed wait for the
+    same attempt instead of opening another connection.
+    """
+    if endpoint.probing is None or endpoint.probing.done():
+      endpoint.probing = asyncio.ensure_future(self._connect(endpoint))
+    # Shielded so a cancelled waiter doesn't cancel the shared attempt.
+    return await asyncio.shield(endpoint.probing)
+
+  async def _connect(self, endpoint: Endpoint) -> bool:
+    try:
+      _, writer = await asyncio.wait_for(
+          asyncio.open_connection(endpoint.host, endpoint.port),
+          self.timeout)
+      writer.close()
+      up = True
+    except (OSError, asyncio.TimeoutError):
+      up = False
+    self._update(endpoint, up)
+    return up
+
+  def _update(self, endpoint: Endpoint, up: bool) -> None:
+    current = time.time()
+    # Compared with the last reported state, so invalidated endpoints
+    # don't notify the listeners unless they really changed.
+    changed = endpoint.reported != up
+    endpoint.up, endpoint.reported, endpoint.checked_at = up, up, current
+    if up:
+      endpoint.failures = 0
+      endpoint.next_probe = current + self.ttl
+      endpoint.event.set()
+    else:
+      endpoint.failures += 1
+      backoff = min(self.max_backoff,
+                    self.base_backoff * 2 ** (endpoint.failures - 1))
+      # Full jitter keeps cameras of a site which went down together from
+      # being probed in lockstep.
+      endpoint.next_probe = current + random.uniform(0.5, 1.0) * backoff
+      endpoint.event.clear()
+    if changed:
+      state = 'connected to' if up else 'not connected to any'
+      self.log.info(f'Camera {endpoint.host}:{endpoint.port} {state} '
+                    'network.')
+      for callback in self._listeners:
+        try:
+          callback(endpoint)
+        except Exception as error:
+          self.log.exception(error)
+
+  async def probe_all(self,
+                      endpoints: Iterable[Endpoint] = None,
+                      force: bool = False) -> Dict[Tuple[str, int], bool]:
+    """Probe all the due endpoints concurrently in one round.
+
+    Args:
+      endpoints: Endpoints (default: all registered) to be probed.
+      force: Boolean (default: False) value to ignore cache & backoff.
+
+    Returns:
+      Dictionary of endpoint & it's state after the round.
+    """
+    current = time.time()
+    endpoints = self.endpoints.values() if endpoints is None else endpoints
+    due = [idx for idx in endpoints if force or idx.due(current)]
+    await asyncio.gather(*[self.probe(idx) for idx in due])
+    return {(idx.host, idx.port): idx.up for idx in due}
+
+  async def wait_until_up(self,
+                          host: str,
+                          port: int = 554,
+                          timeout: Optional[float] = None) -> bool:
+    """Wait until the camera is reported live by the prober.
+
+    Args:
+      host: Camera's IP address.
+      port: Camera port number.
+      timeout: Maximum time (default: None) to wait for the camera.
+
+    Returns:
+      Boolean value if the camera is live.
+    """
+    endpoint = self.register(host, port)
+    if self.is_up(host, port) is None and endpoint.due(time.time()):
+      await self.probe(endpoint)
+    if endpoint.up:
+      return True
+    try:
+      await asyncio.wait_for(endpoint.event.wait(), timeout)
+      return True
+    except asyncio.TimeoutError:
+      return False
+
+  async def run(self) -> None:
+    """Keep probing the endpoints in batched rounds until cancelled."""
+    self._wakeup = asyncio.Event()
+    try:
+      while True:
+        self._wakeup.clear()
+        await self.probe_all()
+        pending = [idx.next_probe for idx in self.endpoints.values()]
+        delay = max(min(pending) - time.time(), 0.0) if pending else None
+        try:
+          await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+    finally:
+      self._wakeup = None
@@ -4,13 +4,16 @@ import logging
 import os
 import subprocess
 import time
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from typing import Optional, Union
 
+import pytz
+
+from video_processing_engine.core.capture.scheduler import (next_occurrence,
+                                                            sleep_until)
 from video_processing_engine.core.process.concate import concate_videos
 from video_processing_engine.core.process.stats import duration as drn
 from video_processing_engine.utils.common import (calculate_duration,
-                                                  datetime_to_utc,
                                                   file_size, now,
                                                   timestamp_dirname)
 from video_processing_engine.utils.generate import video_type
@@ -71,14 +74,26 @@ def start_live_recording(bucket_name: str,
                          camera_port: Union[int, str] = 554,
                          camera_timeout: Union[float, int] = 30.0,
                          timestamp_format: str = '%H:%M:%S',
-                         log: logging.Logger = None) -> Optional[str]:
-  """Saves videos based on time duration."""
+                         log: logging.Logger = None,
+                         camera_timezone: Optional[str] = None
+                         ) -> Optional[str]:
+  """Saves videos based on time duration.
+
+  Start & end times are read in the camera's timezone if it's given,
+  otherwise in the local time of the machine.
+  """
   log = _log(__file__) if log is None else log
-  run_date = datetime.now().strftime('%Y-%m-%d')
+  if camera_timezone:
+    run_date = datetime.now(pytz.timezone(camera_timezone)).strftime(
+        '%Y-%m-%d')
+    force_close = next_occurrence(end_time, camera_timezone, run_date,
+                                  timestamp_format).timestamp()
+  else:
+    run_date = datetime.now().strftime('%Y-%m-%d')
+    force_close = datetime.strptime(f'{run_date} {end_time}',
+                                    f'%Y-%m-%d {timestamp_format}').timestamp()
   start_time, end_time = f'{run_date} {start_time}', f'{run_date} {end_time}'
   duration = calculate_duration(start_time, end_time, timestamp_format, True)
-  force_close = datetime.strptime(
-    end_time, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
   vid_type = video_type(True, True, True)
   temp_path = os.path.join(live,
                            f'{bucket_name}{order_name}_{timestamp_dirname()}')
@@ -96,7 +111,7 @@ def start_live_recording(bucket_name: str,
           file = filename(temp_file, idx)
           log.info('Recording started for selected camera.')
           os.system(ffmpeg_str(url, file, duration, camera_timeout))
-          stop_utc = now().replace(tzinfo=timezone.utc).timestamp()
+          stop_utc = time.time()
           stop_secs = now().second
           _old_file = file_size(file)
           old_duration = stop_secs if _old_file == '300.0 bytes' else drn(file)
@@ -130,14 +145,13 @@ def trigger_live_capture(bucket_name: str,
   """Starts video recording as per the triggering point."""
   log = _log(__file__) if log is None else log
   run_date = datetime.now().strftime('%Y-%m-%d')
-  _start_time = f'{run_date} {start_time}'
-  while True:
-    if str(now()) >= _start_time:
-      return start_live_recording(bucket_name, order_name, start_time,
-                                  end_time, camera_address, camera_username,
-                                  camera_password, camera_port, camera_timeout,
-                                  timestamp_format, log)
-    time.sleep(1.0)
+  _start_time = datetime.strptime(f'{run_date} {start_time}',
+                                  f'%Y-%m-%d {timestamp_format}')
+  sleep_until(_start_time)
+  return start_live_recording(bucket_name, order_name, start_time,
+                              end_time, camera_address, camera_username,
+                              camera_password, camera_port, camera_timeout,
+                              timestamp_format, log)
 
 
 def trigger_utc_capture(bucket_name: str,
@@ -154,24 +168,21 @@ def trigger_utc_capture(bucket_name: str,
                         log: logging.Logger = None) -> str:
   """Starts video recording as per the triggering point."""
   log = _log(__file__) if log is None else log
-  run_date = datetime.now().strftime('%Y-%m-%d')
-  _start_time = f'{run_date} {start_time}'
-  _start_time = datetime_to_utc(_start_time,
-                                camera_timezone,
-                                '%Y-%m-%d %H:%M:%S')
+  _start_time = next_occurrence(start_time, camera_timezone,
+                                timestamp_format=timestamp_format)
   log.info('Video processing engine is scheduled to start '
            f'recording at {_start_time}.')
-  while True:
-    if str(now()) == str(_start_time):
-      log.info('Video processing engine has started recording.')
-      recorded_file =  start_live_recording(bucket_name, order_name, start_time,
-                                            end_time, camera_address,
-                                            camera_username, camera_password,
-                                            camera_port, camera_timeout,
-                                            timestamp_format, log)
-      log.info('Video processing engine has stopped recording.')
-      if recorded_file is None:
-        return 'RecordingError'
-      else:
-        return recorded_file
-    time.sleep(1.0)
+  # Sleeping until the deadline (instead of comparing the timestamps
+  # once a second) never misses the start & fires at once if it's late.
+  sleep_until(_start_time)
+  log.info('Video processing engine has started recording.')
+  recorded_file = start_live_recording(bucket_name, order_name, start_time,
+                                       end_time, camera_address,
+                                       camera_username, camera_password,
+                                       camera_port, camera_timeout,
+                                       timestamp_format, log, camera_timezone)
+  log.info('Video processing engine has stopped recording.')
+  if recorded_file is None:
+    return 'RecordingError'
+  else:
+    return recorded_file
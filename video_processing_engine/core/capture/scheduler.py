@@ -0,0 +1,210 @@
+"""A subservice for scheduling recordings using a heap of deadlines."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional
+
+import pytz
+
+from video_processing_engine.utils.logs import log as _log
+
+
+def next_occurrence(start_time: str,
+                    camera_timezone: str = 'UTC',
+                    run_date: Optional[str] = None,
+                    timestamp_format: str = '%H:%M:%S') -> datetime:
+  """Returns the timezone aware start of the recording.
+
+  Args:
+    start_time: Time when to start recording the video.
+    camera_timezone: Timezone (default: UTC) of the camera.
+    run_date: Date (default: today in camera's timezone) of the run.
+    timestamp_format: Timestamp format of the start time.
+
+  Returns:
+    UTC datetime when the recording needs to start.
+  """
+  zone = pytz.timezone(camera_timezone)
+  if run_date is None:
+    run_date = datetime.now(zone).strftime('%Y-%m-%d')
+  local = datetime.combine(datetime.strptime(run_date, '%Y-%m-%d').date(),
+                           datetime.strptime(start_time,
+                                             timestamp_format).time())
+  # Localizing the naive time (instead of adding 24 hours) keeps the
+  # daily recurrence correct across daylight saving transitions.
+  return zone.localize(local).astimezone(pytz.utc)
+
+
+def sleep_until(deadline: datetime) -> None:
+  """Sleep precisely until the deadline, returns at once if it is late."""
+  if deadline.tzinfo is None:
+    delay = (deadline - datetime.now()).total_seconds()
+  else:
+    delay = (deadline - datetime.now(pytz.utc)).total_seconds()
+  if delay > 0:
+    time.sleep(delay)
+
+
+class Job(object):
+  """A scheduled call with an optional daily recurrence."""
+
+  def __init__(self,
+               name: str,
+               callback: Callable[['Job'], Any],
+               start_time: str,
+               camera_timezone: str = 'UTC',
+               run_date: Optional[str] = None,
+               daily: bool = True,
+               payload: Any = None,
+               timestamp_format: str = '%H:%M:%S') -> None:
+    super(Job, self).__init__()
+    self.name = name
+    self.callback = callback
+    self.start_time = start_time
+    self.camera_timezone = camera_timezone
+    self.daily = daily
+    self.payload = payload
+    self.timestamp_format = timestamp_format
+    self.cancelled = False
+    self.deadline = next_occurrence(start_time, camera_timezone, run_date,
+                                    timestamp_format)
+
+  @property
+  def run_date(self) -> str:
+    """Date of the current occurrence in the camera's timezone."""
+    zone = pytz.timezone(self.camera_timezone)
+    return self.deadline.astimezone(zone).strftime('%Y-%m-%d')
+
+  def following(self) -> 'Job':
+    """Returns occurrence of the job at the same local time next day."""
+    zone = pytz.timezone(self.camera_timezone)
+    run_date = self.deadline.astimezone(zone).date() + timedelta(days=1)
+    return Job(self.name, self.callback, self.start_time,
+               self.camera_timezone, run_date.strftime('%Y-%m-%d'),
+               self.daily, self.payload, self.timestamp_format)
+
+
+class Scheduler(object):
+  """Min-heap of deadlines which wakes up only when a job is due.
+
+  Jobs are kept ordered by their deadline, so the scheduler sleeps for
+  exactly the time left until the earliest job instead of comparing
+  timestamps of every order once a second. Jobs which are already late
+  when the scheduler wakes up are fired immediately.
+
+  Args:
+    log: Logger object.
+  """
+
+  def __init__(self, log: logging.Logger = None) -> None:
+    super(Scheduler, self).__init__()
+    self.log = _log(__file__) if log is None else log
+    self._heap = []
+    self._counter = itertools.count()
+    self._condition = threading.Condition()
+    self._stopped = False
+    self._loop = None
+    self._wakeup = None
+
+  def __len__(self) -> int:
+    return len(self._heap)
+
+  def _push(self, job: Job) -> None:
+    heapq.heappush(self._heap,
+                   (job.deadline.timestamp(), next(self._counter), job))
+
+  def _notify(self) -> None:
+    self._condition.notify_all()
+    if self._loop is not None:
+      self._loop.call_soon_threadsafe(self._wakeup.set)
+
+  def schedule(self, job: Job) -> Job:
+    """Add job to the scheduler & wake up the runner if required."""
+    with self._condition:
+      self._push(job)
+      self.log.info(f'Job "{job.name}" is scheduled to start at '
+                    f'{job.deadline}.')
+      self._notify()
+    return job
+
+  def cancel(self, name: str) -> None:
+    """Cancel all the jobs with the given name."""
+    with self._condition:
+      for _, _, job in self._heap:
+        if job.name == name:
+          job.cancelled = True
+      self._notify()
+
+  def stop(self) -> None:
+    """Stop the runner."""
+    with self._condition:
+      self._stopped = True
+      self._notify()
+
+  def delay(self) -> Optional[float]:
+    """Returns secs left until the next job, None if nothing is queued."""
+    while self._heap and self._heap[0][2].cancelled:
+      heapq.heappop(self._heap)
+    if not self._heap:
+      return None
+    return self._heap[0][0] - time.time()
+
+  def pop_due(self) -> List[Job]:
+    """Pop all jobs which are due & reschedule the recurring ones."""
+    due, current = [], time.time()
+    while self._heap and self._heap[0][0] <= current:
+      _, _, job = heapq.heappop(self._heap)
+      if job.cancelled:
+        continue
+      due.append(job)
+    for job in due:
+      if job.daily:
+        self._push(job.following())
+    return due
+
+  def _fire(self, jobs: List[Job]) -> None:
+    for job in jobs:
+      self.log.info(f'Job "{job.name}" is due for {job.run_date}.')
+      try:
+        job.callback(job)
+      except Exception as error:
+        self.log.exception(error)
+
+  def run(self) -> None:
+    """Run due jobs in the current thread until stopped."""
+    while True:
+      with self._condition:
+        if self._stopped:
+          return
+        delay = self.delay()
+        if delay is None or delay > 0:
+          self._condition.wait(delay)
+          continue
+        jobs = self.pop_due()
+      self._fire(jobs)
+
+  async def arun(self) -> None:
+    """Run due jobs in the running event loop until stopped."""
+    self._loop = asyncio.get_running_loop()
+    self._wakeup = asyncio.Event()
+    try:
+      while not self._stopped:
+        self._wakeup.clear()
+        with self._condition:
+          delay = self.delay()
+          jobs = self.pop_due() if delay is not None and delay <= 0 else []
+        if jobs:
+          self._fire(jobs)
+          continue
+        try:
+          await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+    finally:
+      self._loop, self._wakeup = None, None
+
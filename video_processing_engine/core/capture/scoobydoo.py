@@ -7,6 +7,8 @@ import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Union
 
+from video_processing_engine.core.capture.segments import (
+    SegmentedRecording, recording_window)
 from video_processing_engine.core.process.concate import concate_videos
 from video_processing_engine.core.process.stats import duration as drn
 from video_processing_engine.utils.common import (calculate_duration,
@@ -122,3 +124,95 @@ def live(bucket_name: str,
           time.sleep(camera_timeout)
     except Exception as error:
       log.critical(f'Something went wrong because of {error}')
+
+
+def live_segments(bucket_name: str,
+                  order_name: str,
+                  run_date: str,
+                  start_time: str,
+                  end_time: str,
+                  camera_address: str,
+                  camera_username: str = 'xames3',
+                  camera_password: str = 'iamironman',
+                  camera_port: Union[int, str] = 554,
+                  camera_timeout: Union[float, int, str] = 30.0,
+                  timestamp_format: str = '%H:%M:%S',
+                  segment_length: Union[float, int, str] = 60,
+                  log: logging.Logger = None,
+                  camera_timezone: str = 'UTC') -> Optional[str]:
+  """Record live videos as keyframe aligned segments using FFMPEG.
+
+  Unlike `live()`, the recorded files are never reopened for finding
+  their duration. FFMPEG's segment muxer writes fixed-length segments &
+  reports their offsets which are stored in a wall-clock manifest. The
+  remaining duration after a disconnection is derived from the manifest
+  and the reconnection only continues the segment numbering.
+
+  Args:
+    bucket_name: S3 bucket name.
+    order_name: Order name.
+    run_date: Date when to record the video.
+    start_time: Time when to start recording the video.
+    end_time: Time when to stop recording the video.
+    camera_address: Camera's IP address.
+    camera_username: Camera username.
+    camera_password: Camera password.
+    camera_port: Camera port number.
+    camera_timeout: Maximum time to wait until disconnection occurs.
+    timestamp_format: Timestamp for checking the recording start time.
+    segment_length: Length (default: 60 secs) of each segment.
+    log: Logger object.
+    camera_timezone: Timezone (default: UTC) of the camera, the run date
+                     & times are read in it.
+
+  Returns:
+    Path of the concatenated recording.
+  """
+  log = _log(__file__) if log is None else log
+
+  camera_port = int(camera_port)
+  camera_timeout = float(camera_timeout)
+  segment_length = float(segment_length)
+
+  duration, force_close = recording_window(run_date, start_time, end_time,
+                                           timestamp_format, camera_timezone)
+
+  vid_type = video_type(True, True, True)
+  temp = os.path.join(_lr, f'{bucket_name}{order_name}')
+
+  if not os.path.isdir(temp):
+    os.mkdir(temp)
+  recording = SegmentedRecording(temp, f'{bucket_name}{order_name}{vid_type}',
+                                 duration, force_close, segment_length,
+                                 camera_timeout)
+
+  url = configure_camera_url(camera_address, camera_username,
+                             camera_password, camera_port)
+
+  if duration != 0:
+    try:
+      while True:
+        remaining = recording.remaining()
+
+        if remaining <= 0:
+          return recording.finish()
+
+        if camera_live(camera_address, camera_port, camera_timeout, log):
+          log.info('Recording started for selected camera.')
+          run_started = time.time()
+          subprocess.call(recording.command(url, remaining))
+          entries, backoff = recording.finish_run(run_started)
+          log.info(f'Recorded {len(entries)} segment(s) in this run.')
+          if backoff:
+            log.warning(f'Nothing recorded, attempting after {backoff:.0f} '
+                        'secs.')
+            time.sleep(backoff)
+            recording.lose(backoff)
+        else:
+          log.warning('Unable to record because of poor network connectivity.')
+          recording.lose(camera_timeout)
+          log.warning('Compensating lost time & attempting after '
+                      f'{camera_timeout} secs.')
+          time.sleep(camera_timeout)
+    except Exception as error:
+      log.critical(f'Something went wrong because of {error}')
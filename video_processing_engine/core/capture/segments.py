@@ -0,0 +1,280 @@
+"""A subservice for recording live video as fixed-length segments."""
+
+import csv
+import os
+import time
+from typing import List, Optional, Tuple, Union
+
+from video_processing_engine.core.capture.scheduler import next_occurrence
+from video_processing_engine.core.process.concate import concate_files
+from video_processing_engine.utils.common import calculate_duration
+
+# Columns of the wall-clock manifest written next to the segments.
+MANIFEST_HEADER = ['file', 'wall_start', 'wall_end']
+
+# Longest wait (in secs) after consecutive runs which recorded nothing.
+MAX_BACKOFF = 300.0
+
+
+def segment_paths(directory: str, name: str) -> Tuple[str, str, str, str]:
+  """Returns paths used while recording the segments of a camera.
+
+  Args:
+    directory: Directory where the segments are recorded.
+    name: Common name of the recording.
+
+  Returns:
+    Tuple of segment pattern, FFMPEG segment list, manifest & output.
+  """
+  return (os.path.join(directory, f'{name}_%05d.mp4'),
+          os.path.join(directory, f'{name}.ffcsv'),
+          os.path.join(directory, f'{name}.csv'),
+          os.path.join(directory, f'{name}.mp4'))
+
+
+def segment_args(source: str,
+                 pattern: str,
+                 segment_list: str,
+                 duration: Union[float, int, str],
+                 segment_length: Union[float, int] = 60,
+                 start_number: int = 0,
+                 camera_timeout: Union[float, int, str] = 30.0) -> List[str]:
+  """Returns FFMPEG's segment muxer command as a list of arguments.
+
+  The stream is copied as is & split into fixed-length segments. The
+  segment muxer only cuts on keyframes, so every segment is playable on
+  its own & can be joined back without re-encoding.
+
+  Args:
+    source: RTSP camera url.
+    pattern: Printf style path (e.g. `xa_%05d.mp4`) of the segments.
+    segment_list: Path of the CSV segment list written by FFMPEG.
+    duration: Duration in secs that needs to be captured by FFMPEG.
+    segment_length: Length (default: 60 secs) of each segment.
+    start_number: Index (default: 0) of the first segment.
+    camera_timeout: Maximum time to wait until disconnection occurs.
+
+  Returns:
+    FFMPEG compatible list of arguments for the segmented recording.
+  """
+  ffmpeg = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
+  timeout = int(float(camera_timeout) * 1000000)
+  # `-timeout` is the RTSP socket timeout (in microseconds) of the input,
+  # it replaced `-stimeout` which recent FFMPEG releases reject.
+  return [ffmpeg, '-loglevel', 'error', '-y', '-rtsp_transport', 'tcp',
+          '-timeout', str(timeout), '-i', source, '-vcodec', 'copy',
+          '-acodec', 'copy', '-t', str(duration), '-f', 'segment',
+          '-segment_time', str(segment_length), '-segment_format', 'mp4',
+          '-segment_list', segment_list, '-segment_list_type', 'csv',
+          '-segment_start_number', str(start_number),
+          '-reset_timestamps', '1', pattern]
+
+
+def read_segment_list(segment_list: str) -> List[Tuple[str, float, float]]:
+  """Returns the segments recorded by FFMPEG in a single run.
+
+  Args:
+    segment_list: Path of the CSV segment list written by FFMPEG.
+
+  Returns:
+    List of segment file, start & end offset (in secs) of the run.
+  """
+  if not os.path.isfile(segment_list):
+    return []
+  directory = os.path.dirname(segment_list)
+  with open(segment_list, 'r', newline='') as csv_file:
+    return [(os.path.join(directory, row[0]), float(row[1]), float(row[2]))
+            for row in csv.reader(csv_file) if len(row) == 3]
+
+
+def update_manifest(manifest: str,
+                    segment_list: str,
+                    run_started: float) -> List[Tuple[str, float, float]]:
+  """Appends segments of a finished run to the wall-clock manifest.
+
+  FFMPEG reports segment offsets relative to the start of the run.
+  These offsets are anchored to the wall-clock time at which the run
+  was started so that the manifest describes the entire recording.
+
+  Args:
+    manifest: Path of the wall-clock manifest.
+    segment_list: Path of the CSV segment list written by FFMPEG.
+    run_started: Epoch time when the FFMPEG run was started.
+
+  Returns:
+    List of segment file, wall-clock start & end added to the manifest.
+  """
+  entries = [(file, run_started + start, run_started + end)
+             for file, start, end in read_segment_list(segment_list)
+             if os.path.isfile(file)]
+  exists = os.path.isfile(manifest)
+  with open(manifest, 'a', newline='') as csv_file:
+    _file = csv.writer(csv_file)
+    if not exists:
+      _file.writerow(MANIFEST_HEADER)
+    _file.writerows([(os.path.basename(file), f'{start:.3f}', f'{end:.3f}')
+                     for file, start, end in entries])
+  if os.path.isfile(segment_list):
+    os.remove(segment_list)
+  return entries
+
+
+def read_manifest(manifest: str) -> List[Tuple[str, float, float]]:
+  """Returns all segments recorded so far in wall-clock order.
+
+  Args:
+    manifest: Path of the wall-clock manifest.
+
+  Returns:
+    List of segment file, wall-clock start & end.
+  """
+  if not os.path.isfile(manifest):
+    return []
+  directory = os.path.dirname(manifest)
+  with open(manifest, 'r', newline='') as csv_file:
+    rows = list(csv.DictReader(csv_file))
+  entries = [(os.path.join(directory, row['file']), float(row['wall_start']),
+              float(row['wall_end'])) for row in rows]
+  return sorted(entries, key=lambda entry: entry[1])
+
+
+def recorded_duration(manifest: str) -> float:
+  """Returns total duration (in secs) recorded as per the manifest."""
+  return sum(end - start for _, start, end in read_manifest(manifest))
+
+
+def next_segment_number(manifest: str) -> int:
+  """Returns index of the next segment to continue the numbering."""
+  return len(read_manifest(manifest))
+
+
+def recording_window(run_date: str,
+                     start_time: str,
+                     end_time: str,
+                     timestamp_format: str = '%H:%M:%S',
+                     camera_timezone: str = 'UTC') -> Tuple[float, float]:
+  """Returns duration & forced closing time of the recording.
+
+  Args:
+    run_date: Date (in camera's timezone) when to record the video.
+    start_time: Time when to start recording the video.
+    end_time: Time when to stop recording the video.
+    timestamp_format: Timestamp for checking the recording start time.
+    camera_timezone: Timezone (default: UTC) of the camera.
+
+  Returns:
+    Tuple of duration in secs & epoch timestamp when recording must stop.
+  """
+  force_close = next_occurrence(end_time, camera_timezone, run_date,
+                                timestamp_format).timestamp()
+  start_time, end_time = f'{run_date} {start_time}', f'{run_date} {end_time}'
+  duration = calculate_duration(start_time, end_time, timestamp_format, True)
+  return duration, force_close
+
+
+def remaining_duration(duration: float,
+                       manifest: str,
+                       lost_duration: float,
+                       force_close: float) -> float:
+  """Returns duration (in secs) which is still left to be recorded.
+
+  Args:
+    duration: Total duration of the recording.
+    manifest: Path of the wall-clock manifest.
+    lost_duration: Duration lost due to disconnections.
+    force_close: Epoch timestamp when recording must stop.
+
+  Returns:
+    Duration left to be recorded.
+  """
+  remaining = duration - recorded_duration(manifest) - lost_duration
+  return min(remaining, force_close - time.time())
+
+
+class SegmentedRecording(object):
+  """Book-keeping of a recording made of one or more FFMPEG runs.
+
+  Shared by the blocking & the asyncio recorders, which only differ in
+  how they spawn FFMPEG & wait. Every run continues the numbering of the
+  segments & is added to the wall-clock manifest once it exits.
+
+  Args:
+    directory: Directory where the segments are recorded.
+    name: Common name of the recording.
+    duration: Total duration (in secs) of the recording.
+    force_close: Epoch timestamp when recording must stop.
+    segment_length: Length (default: 60 secs) of each segment.
+    camera_timeout: Maximum time (default: 30 secs) to wait until
+                    disconnection occurs.
+  """
+
+  def __init__(self,
+               directory: str,
+               name: str,
+               duration: float,
+               force_close: float,
+               segment_length: Union[float, int] = 60,
+               camera_timeout: Union[float, int] = 30.0) -> None:
+    super(SegmentedRecording, self).__init__()
+    (self.pattern, self.segment_list,
+     self.manifest, self.output) = segment_paths(directory, name)
+    self.duration = duration
+    self.force_close = force_close
+    self.segment_length = segment_length
+    self.camera_timeout = float(camera_timeout)
+    self.lost_duration = 0.0
+    self.empty_runs = 0
+
+  def remaining(self) -> float:
+    """Returns duration (in secs) which is still left to be recorded."""
+    return remaining_duration(self.duration, self.manifest,
+                              self.lost_duration, self.force_close)
+
+  def lose(self, seconds: float) -> None:
+    """Add time (in secs) lost without recording."""
+    self.lost_duration += max(seconds, 0.0)
+
+  def command(self, source: str, remaining: float) -> List[str]:
+    """Returns FFMPEG command recording the next run of the source."""
+    return segment_args(source, self.pattern, self.segment_list, remaining,
+                        self.segment_length,
+                        next_segment_number(self.manifest),
+                        self.camera_timeout)
+
+  def finish_run(self,
+                 run_started: float) -> Tuple[List[Tuple[str, float, float]],
+                                              float]:
+    """Add segments of the finished run to the manifest.
+
+    Args:
+      run_started: Epoch time when the FFMPEG run was started.
+
+    Returns:
+      Segments added by the run & time (in secs) to wait before the next
+      run. Runs which record nothing (like FFMPEG rejecting the camera)
+      back off exponentially instead of respawning FFMPEG right away.
+    """
+    entries = update_manifest(self.manifest, self.segment_list, run_started)
+    # Time between the start of the run & the first segment along with
+    # the time after the last segment is lost to reconnection.
+    recorded = sum(end - start for _, start, end in entries)
+    self.lose(time.time() - run_started - recorded)
+    if entries:
+      self.empty_runs = 0
+      return entries, 0.0
+    self.empty_runs += 1
+    backoff = min(self.camera_timeout * 2 ** (self.empty_runs - 1),
+                  MAX_BACKOFF)
+    return entries, max(min(backoff, self.remaining()), 0.0)
+
+  def finish(self) -> Optional[str]:
+    """Join the recorded segments, returns None if nothing was recorded.
+
+    The manifest is removed only once the segments are joined, so a
+    failed join leaves the recording intact.
+    """
+    segments = [file for file, _, _ in read_manifest(self.manifest)]
+    output = concate_files(segments, self.output) if segments else None
+    if output and os.path.isfile(self.manifest):
+      os.remove(self.manifest)
+    return output
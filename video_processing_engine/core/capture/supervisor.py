@@ -0,0 +1,257 @@
+"""A subservice for supervising live recordings of multiple cameras."""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from video_processing_engine.core.capture.liveness import LivenessProber
+from video_processing_engine.core.capture.segments import (
+    SegmentedRecording, recording_window)
+from video_processing_engine.utils.common import now
+from video_processing_engine.utils.generate import (bucket_name, order_name,
+                                                    video_type)
+from video_processing_engine.utils.logs import log as _log
+from video_processing_engine.utils.opencvapi import configure_camera_url
+from video_processing_engine.utils.paths import live as _lr
+
+# States of a camera recording reported by the supervisor.
+WAITING, ACTIVE, FAILED, DONE = 'waiting', 'active', 'failed', 'done'
+
+
+class CameraState(object):
+  """Book-keeping of a single camera recording."""
+
+  def __init__(self, name: str, host: str) -> None:
+    super(CameraState, self).__init__()
+    self.name = name
+    self.host = host
+    self.status = WAITING
+    self.failures = 0
+    self.retry_at = None
+    self.error = None
+    self.output = None
+
+
+class CaptureSupervisor(object):
+  """Runs recordings of all the cameras in a single event loop.
+
+  Every recording is an asyncio task which spawns FFMPEG's segment
+  muxer as a subprocess, so no thread is blocked while the cameras are
+  being recorded. Recordings for the same camera host are limited by a
+  per-host semaphore & disconnections are retried using non-blocking
+  timers.
+
+  Args:
+    max_per_host: Maximum (default: 2) concurrent recordings per host.
+    max_failures: Maximum (default: 10) consecutive failed attempts
+                  before the camera is reported as failed. Recording is
+                  still retried until it's closing time & the camera is
+                  reported as active again once it reconnects.
+    prober: Shared liveness prober (default: None) of the cameras. When
+            available, recordings wait for the prober to report their
+            camera as live instead of probing it themselves.
+    log: Logger object.
+  """
+
+  def __init__(self,
+               max_per_host: int = 2,
+               max_failures: int = 10,
+               prober: Optional[LivenessProber] = None,
+               log: logging.Logger = None) -> None:
+    super(CaptureSupervisor, self).__init__()
+    self.max_per_host = max_per_host
+    self.max_failures = max_failures
+    self.prober = prober
+    self.log = _log(__file__) if log is None else log
+    self.cameras: Dict[str, CameraState] = {}
+    self._limits: Dict[str, asyncio.Semaphore] = {}
+    self._processes: Dict[str, asyncio.subprocess.Process] = {}
+    self._tasks: Set[asyncio.Task] = set()
+
+  def _limit(self, host: str) -> asyncio.Semaphore:
+    """Returns semaphore limiting the recordings of the host."""
+    if host not in self._limits:
+      self._limits[host] = asyncio.Semaphore(self.max_per_host)
+    return self._limits[host]
+
+  async def reachable(self,
+                      camera_address: str,
+                      camera_port: int = 554,
+                      timeout: float = 10.0) -> bool:
+    """Check if camera is reachable without blocking the event loop."""
+    if self.prober is not None:
+      return await self.prober.wait_until_up(camera_address, camera_port,
+                                             timeout)
+    try:
+      _, writer = await asyncio.wait_for(
+          asyncio.open_connection(camera_address, camera_port), timeout)
+      writer.close()
+      return True
+    except (OSError, asyncio.TimeoutError):
+      return False
+
+  async def record(self,
+                   name: str,
+                   json_data: dict,
+                   run_date: str,
+                   curr: datetime = None) -> Optional[str]:
+    """Record the camera as per the order in segments.
+
+    Args:
+      name: Unique name of the recording.
+      json_data: JSON dictionary which Admin sends to VPE.
+      run_date: Date (in camera's timezone) when to record the video.
+      curr: Timestamp (default: None) used for naming the order.
+
+    Returns:
+      Path of the concatenated recording.
+    """
+    log = self.log
+    curr = now() if curr is None else curr
+
+    country = json_data.get('country_code', 'xa')
+    customer = json_data.get('customer_id', 0)
+    contract = json_data.get('contract_id', 0)
+    order = json_data.get('order_id', 0)
+    store = json_data.get('store_id', 0)
+    area = json_data.get('area_code', 'e')
+    camera = json_data.get('camera_id', 0)
+    start_time = json_data['start_time']
+    end_time = json_data['end_time']
+    address = json_data['camera_address']
+    username = json_data.get('camera_username', 'admin')
+    password = json_data['camera_password']
+    port = int(json_data.get('camera_port', 554))
+    timeout = float(json_data.get('camera_timeout', 30.0))
+    timestamp = json_data.get('timestamp_format', '%H:%M:%S')
+    segment_length = float(json_data.get('segment_length', 60))
+    camera_timezone = json_data.get('camera_timezone', 'UTC')
+
+    state = self.cameras[name] = CameraState(name, address)
+
+    try:
+      bucket = bucket_name(country, customer, contract, order, log)
+      order = order_name(store, area, camera, curr, log)
+
+      duration, force_close = recording_window(run_date, start_time,
+                                               end_time, timestamp,
+                                               camera_timezone)
+      temp = os.path.join(_lr, f'{bucket}{order}')
+
+      if not os.path.isdir(temp):
+        os.mkdir(temp)
+      recording = SegmentedRecording(
+          temp, f'{bucket}{order}{video_type(True, True, True)}', duration,
+          force_close, segment_length, timeout)
+
+      url = configure_camera_url(address, username, password, port)
+
+      while True:
+        remaining = recording.remaining()
+        if remaining <= 0:
+          break
+
+        if state.status != FAILED:
+          state.status = WAITING
+        waiting_since = time.time()
+        if not await self.reachable(address, port, timeout):
+          state.failures += 1
+          if self.max_failures and state.failures == self.max_failures:
+            # Reported as failed but still retried till the closing time
+            # as the camera may come back within the shift.
+            state.status = FAILED
+            state.error = 'Camera not connected to any network.'
+            log.error(f'Camera #{camera} unreachable after '
+                      f'{state.failures} attempts, retrying until closing '
+                      'time.')
+          if self.prober is None:
+            log.warning(f'Camera #{camera} unreachable, attempting after '
+                        f'{timeout} secs.')
+            state.retry_at = time.time() + timeout
+            await asyncio.sleep(timeout)
+          recording.lose(time.time() - waiting_since)
+          continue
+
+        async with self._limit(address):
+          # Time spent waiting for the camera or for a free slot on the
+          # host is lost, so the remaining duration is computed again.
+          recording.lose(time.time() - waiting_since)
+          remaining = recording.remaining()
+          if remaining <= 0:
+            break
+          state.status, state.failures, state.retry_at = ACTIVE, 0, None
+          state.error = None
+          log.info(f'Recording started for camera #{camera}.')
+          run_started = time.time()
+          process = await asyncio.create_subprocess_exec(
+              *recording.command(url, remaining),
+              stdin=asyncio.subprocess.DEVNULL)
+          self._processes[name] = process
+          try:
+            await process.wait()
+          finally:
+            self._processes.pop(name, None)
+
+        if self.prober is not None:
+          # FFMPEG exiting before the deadline usually means the camera
+          # dropped, so the cached state must not be trusted anymore.
+          self.prober.invalidate(address, port)
+        _, backoff = recording.finish_run(run_started)
+        if backoff:
+          log.warning(f'Nothing recorded for camera #{camera}, attempting '
+                      f'after {backoff:.0f} secs.')
+          state.retry_at = time.time() + backoff
+          await asyncio.sleep(backoff)
+          recording.lose(backoff)
+
+      loop = asyncio.get_running_loop()
+      output = await loop.run_in_executor(None, recording.finish)
+      state.status = DONE if output else FAILED
+      state.output = output
+      log.info(f'Recording stopped for camera #{camera}.')
+      return output
+    except asyncio.CancelledError:
+      process = self._processes.pop(name, None)
+      if process and process.returncode is None:
+        process.terminate()
+      raise
+    except Exception as error:
+      state.status, state.error = FAILED, str(error)
+      log.exception(error)
+
+  def submit(self,
+             name: str,
+             json_data: dict,
+             run_date: str) -> asyncio.Task:
+    """Schedule recording of the camera in the running event loop.
+
+    The task is held by the supervisor until it finishes so that it is
+    not garbage collected mid-recording & can be cancelled on shutdown.
+    """
+    task = asyncio.ensure_future(self.record(name, json_data, run_date))
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+    return task
+
+  def status(self) -> Dict[str, List[str]]:
+    """Returns names of active, waiting & failed camera recordings."""
+    report = {ACTIVE: [], WAITING: [], FAILED: []}
+    for name, state in self.cameras.items():
+      if state.status in report:
+        report[state.status].append(name)
+    return report
+
+  async def shutdown(self) -> None:
+    """Terminate all the running recordings & cancel their tasks."""
+    processes = list(self._processes.values())
+    for process in processes:
+      if process.returncode is None:
+        process.terminate()
+    tasks = list(self._tasks)
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*[process.wait() for process in processes], *tasks,
+                         return_exceptions=True)
@@ -0,0 +1,147 @@
+"""A subservice for modelling the background of the camera scene."""
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+# Polygon is a list of (x, y) points, relative (0-1) to the frame size.
+Polygon = Sequence[Tuple[float, float]]
+
+
+class StaticBackground(object):
+  """Uses the very first frame as background forever."""
+  adaptive = False
+
+  def __init__(self, threshold: int = 25) -> None:
+    super(StaticBackground, self).__init__()
+    self.threshold = threshold
+    self.background = None
+
+  def apply(self, frame: np.ndarray) -> Optional[np.ndarray]:
+    """Returns binary foreground mask, None if frame is used as reference.
+
+    Args:
+      frame: Numpy array of the blurred grayscale image frame.
+    """
+    if self.background is None:
+      self.background = frame
+      return None
+    delta = cv2.absdiff(self.background, frame)
+    return cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+class RunningAverageBackground(StaticBackground):
+  """Keeps exponentially weighted average of the frames as background.
+
+  Args:
+    alpha: Weight (default: 0.05) of the latest frame in the average.
+    threshold: Minimum (default: 25) pixel difference considered motion.
+  """
+  adaptive = True
+
+  def __init__(self, alpha: float = 0.05, threshold: int = 25) -> None:
+    super(RunningAverageBackground, self).__init__(threshold)
+    self.alpha = alpha
+
+  def apply(self, frame: np.ndarray) -> Optional[np.ndarray]:
+    if self.background is None:
+      self.background = frame.astype(np.float32)
+      return None
+    delta = cv2.absdiff(cv2.convertScaleAbs(self.background), frame)
+    # Slow lighting changes are absorbed by the average, moving objects
+    # are not around long enough to be.
+    cv2.accumulateWeighted(frame, self.background, self.alpha)
+    return cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+class SubtractorBackground(object):
+  """Wraps OpenCV's Gaussian mixture (MOG2) or KNN background subtractor.
+
+  Args:
+    method: Subtractor to be used, either `mog2` or `knn`.
+    history: Number of frames (default: 500) affecting the background.
+    var_threshold: Threshold (default: None -> OpenCV's default) on the
+                   distance between a pixel & the model.
+    detect_shadows: Boolean (default: True) value to detect shadows, the
+                    detected shadows are never reported as motion.
+  """
+  adaptive = True
+
+  def __init__(self,
+               method: str = 'mog2',
+               history: int = 500,
+               var_threshold: Optional[float] = None,
+               detect_shadows: bool = True) -> None:
+    super(SubtractorBackground, self).__init__()
+    if method == 'knn':
+      self.subtractor = cv2.createBackgroundSubtractorKNN(
+          history, 400.0 if var_threshold is None else var_threshold,
+          detect_shadows)
+    else:
+      self.subtractor = cv2.createBackgroundSubtractorMOG2(
+          history, 16.0 if var_threshold is None else var_threshold,
+          detect_shadows)
+    self.warm = False
+
+  def apply(self, frame: np.ndarray) -> Optional[np.ndarray]:
+    mask = self.subtractor.apply(frame)
+    if not self.warm:
+      # Whole frame is foreground until the model has seen a frame.
+      self.warm = True
+      return None
+    # Shadows are marked as 127, only the sure foreground is kept.
+    return cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)[1]
+
+
+def background_model(name: str = 'static', **kwargs) -> Union[
+        StaticBackground, RunningAverageBackground, SubtractorBackground]:
+  """Returns background model by it's name.
+
+  Args:
+    name: Background model (default: static) to be used, either `static`,
+          `running_average`, `mog2` or `knn`.
+    kwargs: Options supported by the selected model.
+  """
+  if name == 'running_average':
+    return RunningAverageBackground(**kwargs)
+  if name in ('mog2', 'knn'):
+    return SubtractorBackground(name, **kwargs)
+  if name != 'static':
+    raise ValueError(f'Unsupported background model "{name}".')
+  return StaticBackground(**kwargs)
+
+
+def roi_mask(shape: Tuple[int, ...],
+             regions: Optional[List[Polygon]] = None,
+             exclusions: Optional[List[Polygon]] = None) -> Optional[np.ndarray]:
+  """Returns mask of the frame portions to be analyzed.
+
+  Points of the polygons are relative to the frame size, so the same
+  camera config works for every resize width.
+
+  Args:
+    shape: Shape of the frames to be masked.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored, like clocks,
+                trees or screens in the camera view.
+
+  Returns:
+    Binary mask of the frame, None if nothing has to be masked.
+  """
+  if not regions and not exclusions:
+    return None
+  height, width = shape[:2]
+  scale = np.array([width, height], np.float32)
+
+  def _points(polygon: Polygon) -> np.ndarray:
+    return np.round(np.array(polygon, np.float32) * scale).astype(np.int32)
+
+  if regions:
+    mask = np.zeros((height, width), np.uint8)
+    cv2.fillPoly(mask, [_points(idx) for idx in regions], 255)
+  else:
+    mask = np.full((height, width), 255, np.uint8)
+  if exclusions:
+    cv2.fillPoly(mask, [_points(idx) for idx in exclusions], 0)
+  return mask
@@ -1,83 +1,116 @@
-from collections import deque
 from threading import Thread
-from queue import Queue
-import time
+from queue import Full, Queue
 import cv2
+import numpy as np
+
+# marker put on the queue to tell the writer thread to stop
+_SENTINEL = None
 
 
 class KeyClipWriter:
-  def __init__(self, bufSize=64, timeout=1.0):
+  def __init__(self, bufSize=64, timeout=1.0, queueSize=None, encoder=None):
     # store the maximum buffer size of frames to be kept
-    # in memory along with the sleep timeout during threading
+    # in memory, the maximum time to wait for a free slot in
+    # the queue, the maximum number of frames to be queued &
+    # the optional encoder (called with output path, fps and
+    # frame size) used instead of OpenCV's video writer
     self.bufSize = bufSize
     self.timeout = timeout
+    self.queueSize = queueSize or bufSize * 2
+    self.encoder = encoder
 
-    # initialize the buffer of frames, queue of frames that
-    # need to be written to file, video writer, writer thread,
-    # and boolean indicating whether recording has started or not
-    self.frames = deque(maxlen=bufSize)
+    # initialize the ring buffer of frames (allocated once the
+    # first frame arrives), the position of the next slot, count
+    # of buffered frames, queue of frames that need to be written
+    # to file, video writer, writer thread, and boolean indicating
+    # whether recording has started or not
+    self.ring = None
+    self.index = 0
+    self.count = 0
     self.Q = None
     self.writer = None
     self.thread = None
     self.recording = False
 
+    # counters of frames which had to wait for the writer and
+    # frames which were dropped as the writer couldn't keep up
+    self.blocked = 0
+    self.dropped = 0
+
   def update(self, frame):
-    # update the frames buffer
-    self.frames.appendleft(frame)
+    # allocate the ring buffer using the first frame, frames are
+    # copied into the preallocated slots so the memory used by
+    # the pre-roll never grows
+    if self.ring is None or self.ring.shape[1:] != frame.shape:
+      self.ring = np.empty((self.bufSize,) + frame.shape, frame.dtype)
+      self.index, self.count = 0, 0
+    np.copyto(self.ring[self.index], frame)
+    self.index = (self.index + 1) % self.bufSize
+    self.count = min(self.count + 1, self.bufSize)
 
     # if we are recording, update the queue as well
     if self.recording:
-      self.Q.put(frame)
+      self.put(frame)
+
+  def put(self, frame):
+    # hand the frame over to the writer without waiting if there
+    # is room in the queue, otherwise wait for the writer for at
+    # most `timeout` seconds before dropping the frame
+    try:
+      self.Q.put_nowait(frame)
+    except Full:
+      self.blocked += 1
+      try:
+        self.Q.put(frame, timeout=self.timeout)
+      except Full:
+        self.dropped += 1
 
   def start(self, outputPath, fourcc, fps):
     # indicate that we are recording, start the video writer,
-    # and initialize the queue of frames that need to be written
-    # to the video file
+    # and initialize the bounded queue of frames that need to
+    # be written to the video file
     self.recording = True
-    self.writer = cv2.VideoWriter(outputPath, fourcc, fps,
-                                  (self.frames[0].shape[1],
-                                   self.frames[0].shape[0]), True)
-    self.Q = Queue()
-    # loop over the frames in the deque structure and add them
-    # to the queue
-    for i in range(len(self.frames), 0, -1):
-      self.Q.put(self.frames[i - 1])
+    size = (self.ring.shape[2], self.ring.shape[1])
+    if self.encoder is not None:
+      self.writer = self.encoder(outputPath, fps, size)
+    else:
+      self.writer = cv2.VideoWriter(outputPath, fourcc, fps, size, True)
+    self.Q = Queue(maxsize=self.queueSize)
 
     # start a thread write frames to the video file
     self.thread = Thread(target=self.write, args=())
     self.thread.daemon = True
     self.thread.start()
 
+    # copy the buffered frames oldest first in a single shot, as
+    # the ring slots get overwritten by the upcoming frames, and
+    # add them to the queue (waiting for the writer if needed)
+    order = (np.arange(self.count) + self.index - self.count) % self.bufSize
+    for frame in self.ring[order]:
+      self.Q.put(frame)
+
   def write(self):
-    # keep looping
+    # block until the next frame arrives and write it to the
+    # video file, exit the thread once the sentinel is received
     while True:
-      # if we are done recording, exit the thread
-      if not self.recording:
+      frame = self.Q.get()
+      if frame is _SENTINEL:
         return
-
-      # check to see if there are entries in the queue
-      if not self.Q.empty():
-        # grab the next frame in the queue and write it
-        # to the video file
-        frame = self.Q.get()
-        self.writer.write(frame)
-
-      # otherwise, the queue is empty, so sleep for a bit
-      # so we don't waste CPU cycles
-      else:
-        time.sleep(self.timeout)
+      self.writer.write(frame)
 
   def flush(self):
     # empty the queue by flushing all remaining frames to file
     while not self.Q.empty():
       frame = self.Q.get()
-      self.writer.write(frame)
+      if frame is not _SENTINEL:
+        self.writer.write(frame)
 
   def finish(self):
-    # indicate that we are done recording, join the thread,
-    # flush all remaining frames in the queue to file, and
-    # release the writer pointer
+    # indicate that we are done recording, ask the writer thread
+    # to stop once the queued frames are written, join the thread
+    # and release the writer pointer
     self.recording = False
+    self.Q.put(_SENTINEL)
     self.thread.join()
     self.flush()
     self.writer.release()
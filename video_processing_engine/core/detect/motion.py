@@ -1,28 +1,91 @@
 """A subservice for detection motion in videos."""
 
+import bisect
 import csv
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from pathlib import Path
-from typing import Optional, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
 import cv2
 import imutils
+import numpy as np
 
+from video_processing_engine.core.detect.background import (Polygon,
+                                                            background_model,
+                                                            roi_mask)
 from video_processing_engine.core.detect.keyclipwriter import KeyClipWriter
-from video_processing_engine.core.process.concate import concate_videos
+from video_processing_engine.core.detect.prescreen import prescreen
+from video_processing_engine.core.detect.sources import (FFmpegFrameSource,
+                                                         open_source)
+from video_processing_engine.core.detect.timeline import (ActivityTimeline,
+                                                          timeline_path)
+from video_processing_engine.core.process.concate import (concate_intervals,
+                                                          concate_videos)
+from video_processing_engine.core.process.encoder import FFmpegWriter
+from video_processing_engine.core.process.keyframes import keyframes
+from video_processing_engine.core.process.stats import duration
 from video_processing_engine.utils.common import seconds_to_datetime as s2d
 from video_processing_engine.utils.local import filename
 from video_processing_engine.utils.logs import log as _log
-from video_processing_engine.utils.opencvapi import (disconnect,
-                                                     draw_bounding_box,
+from video_processing_engine.utils.opencvapi import (draw_bounding_box,
                                                      rescale)
 from video_processing_engine.vars import dev
 
 
-def motion_meta(boxes: int, occurence: Union[float, int]) -> str:
-  box = 'Bounding box' if boxes == 1 else 'Bounding boxes'
-  return f'{boxes} {box} detected at {s2d(int(occurence / 1000))}'
+class MotionDetector(object):
+  """Detects motion using Background Subtraction.
+
+  Args:
+    precision: Minimum contour area (default: 1500) considered motion.
+    background: Background model (default: static -> first frame) to be
+                used, either `static`, `running_average`, `mog2` or `knn`.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+  """
+
+  def __init__(self,
+               precision: int = 1500,
+               background: str = 'static',
+               regions: Optional[List[Polygon]] = None,
+               exclusions: Optional[List[Polygon]] = None) -> None:
+    super(MotionDetector, self).__init__()
+    self.precision = precision
+    self.model = background_model(background)
+    self.regions = regions
+    self.exclusions = exclusions
+    self.mask = None
+
+  def detect(self, frame: np.ndarray) -> Optional[List[Tuple]]:
+    """Returns bounding boxes (x, y, w, h) of the moving regions.
+
+    Args:
+      frame: Numpy array of the BGR or grayscale image frame.
+
+    Returns:
+      List of bounding boxes, None if the frame is used as reference.
+    """
+    gray_frame = frame
+    if frame.ndim == 3:
+      gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray_frame = cv2.GaussianBlur(gray_frame, (21, 21), 0)
+    threshold = self.model.apply(gray_frame)
+    if threshold is None:
+      return None
+    threshold = cv2.dilate(threshold, None, iterations=2)
+    if self.regions or self.exclusions:
+      if self.mask is None or self.mask.shape != threshold.shape:
+        self.mask = roi_mask(threshold.shape, self.regions, self.exclusions)
+      # Masking after dilation keeps the blobs from bleeding back into
+      # the excluded portions.
+      threshold = cv2.bitwise_and(threshold, self.mask)
+    contours = cv2.findContours(threshold, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)
+    contours = imutils.grab_contours(contours)
+    return [cv2.boundingRect(contour) for contour in contours
+            if cv2.contourArea(contour) >= self.precision]
 
 
 def track_motion(file: str,
@@ -30,12 +93,19 @@ def track_motion(file: str,
                  resize: bool = True,
                  resize_width: int = 640,
                  debug_mode: bool = True,
+                 frame_source: str = 'opencv',
+                 background: str = 'static',
+                 regions: Optional[List[Polygon]] = None,
+                 exclusions: Optional[List[Polygon]] = None,
+                 prescreen_method: Optional[str] = None,
+                 prescreen_threshold: Optional[float] = None,
                  log: logging.Logger = None) -> Optional[str]:
   """Track motion in the video using Background Subtraction method."""
   log = _log(__file__) if log is None else log
-  kcw = KeyClipWriter(bufSize=32)
-  consec_frames, x0, y0, x1, y1 = 0, 0, 0, 0, 0
-  boxes, temp_csv_entries = [], []
+  kcw = KeyClipWriter(bufSize=32, encoder=FFmpegWriter)
+  detector = MotionDetector(precision, background, regions, exclusions)
+  consec_frames = 0
+  timeline = ActivityTimeline()
   directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}')
   if not os.path.isdir(directory):
     os.mkdir(directory)
@@ -45,47 +115,36 @@ def track_motion(file: str,
     log.info('Debug mode - Enabled.')
   log.info(f'Analyzing motion for "{os.path.basename(file)}".')
   try:
-    stream = cv2.VideoCapture(file)
-    fps = stream.get(cv2.CAP_PROP_FPS)
-    first_frame = None
-    while True:
-      valid_frame, frame = stream.read()
-      if not valid_frame:
-        break
-      if frame is None:
-        break
-      if resize:
-        frame = rescale(frame, resize_width)
+    ranges = [(None, None)]
+    if prescreen_method:
+      ranges = prescreen(file, prescreen_method, prescreen_threshold, log=log)
+      if not ranges:
+        return file
+    # Clips may run across the skipped portions, which is fine as all of
+    # them end up concatenated anyway.
+    sources = [open_source(file, frame_source, resize, resize_width,
+                           start=start, end=end) for start, end in ranges]
+    fps = sources[0].fps
+    for position, frame in chain.from_iterable(sources):
       update_frame = True
-      gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-      gray_frame = cv2.GaussianBlur(gray_frame, (21, 21), 0)
-      if first_frame is None:
-        first_frame = gray_frame
+      boxes = detector.detect(frame)
+      if boxes is None:
         continue
-      frame_delta = cv2.absdiff(first_frame, gray_frame)
-      threshold = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-      threshold = cv2.dilate(threshold, None, iterations=2)
-      contours = cv2.findContours(threshold.copy(), cv2.RETR_EXTERNAL,
-                                  cv2.CHAIN_APPROX_SIMPLE)
-      contours = imutils.grab_contours(contours)
-      for contour in contours:
-        if cv2.contourArea(contour) < precision:
-          continue
+      timeline.record(position, boxes)
+      for (x0, y0, x1, y1) in boxes:
         if debug_mode:
-          (x0, y0, x1, y1) = cv2.boundingRect(contour)
           draw_bounding_box(frame, (x0, y0), (x0 + x1, y0 + y1))
         consec_frames = 0
         if not kcw.recording:
           kcw.start(filename(temp_file, idx),
                     cv2.VideoWriter_fourcc(*'mp4v'), fps)
           idx += 1
-        boxes.append([x1, y1])
-        status = motion_meta(len(boxes), stream.get(cv2.CAP_PROP_POS_MSEC))
-        # log.info(status)
-        temp_csv_entries.append(status)
-      boxes = []
       if update_frame:
         consec_frames += 1
+      if kcw.recording and frame_source == 'ffmpeg':
+        # Buffers of the FFMPEG source are reused while the queued frames
+        # wait for the writer, hence the copy.
+        frame = frame.copy()
       kcw.update(frame)
       if kcw.recording and consec_frames == 32:
         log.info('Extracting buffered portion of video with detected motion.')
@@ -93,24 +152,497 @@ def track_motion(file: str,
       if debug_mode:
         cv2.imshow('Video Processing Engine - Motion Detection', frame)
       if cv2.waitKey(1) & 0xFF == int(27):
-        disconnect(stream)
+        break
     if kcw.recording:
       kcw.finish()
+    if kcw.blocked or kcw.dropped:
+      log.warning(f'Writer stalled for {kcw.blocked} frame(s) & dropped '
+                  f'{kcw.dropped} frame(s).')
     if len(os.listdir(directory)) < 1:
+      timeline.save(timeline_path(file))
       return file
     concate_temp = concate_videos(directory, delete_old_files=True)
-    with open(os.path.join(directory, f'{Path(file).stem}.csv'), 'a',
-              encoding=dev.DEF_CHARSET) as csv_file:
-      log.info('Logging detections into a CSV file.')
-      _file = csv.writer(csv_file, delimiter='\n', quoting=csv.QUOTE_MINIMAL)
-      _file.writerow(temp_csv_entries)
+    log.info('Saving motion activity timeline.')
+    timeline.save(timeline_path(file))
     if concate_temp:
       if os.path.isfile(concate_temp):
-        log.info('Applying H264 encoding for bypassing browser issues.')
-        os.system(f'ffmpeg -loglevel error -y -i {concate_temp} -vcodec '
-                  f'libx264 {temp_file}')
-        log.info('Cleaning up archived files.')
-        os.remove(concate_temp)
+        # Clips are already encoded in H264 by the writer.
+        os.replace(concate_temp, temp_file)
         return temp_file
   except Exception as error:
     log.critical(f'Something went wrong because of {error}')
+
+
+def merge_intervals(intervals: List[Tuple[float, float]],
+                    padding: float = 0.0,
+                    limit: Optional[float] = None) -> List[Tuple[float, float]]:
+  """Pads, clips & merges the overlapping intervals.
+
+  Args:
+    intervals: List of start & end (in secs) of the intervals.
+    padding: Time (default: 0 secs) added on both sides of an interval.
+    limit: Maximum (default: None) value of the end of an interval.
+
+  Returns:
+    Sorted list of non-overlapping intervals.
+  """
+  merged = []
+  for start, end in sorted(intervals):
+    start, end = max(start - padding, 0.0), end + padding
+    if limit is not None:
+      end = min(end, limit)
+    if merged and start <= merged[-1][1]:
+      merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+    else:
+      merged.append((start, end))
+  return merged
+
+
+def snap_to_keyframes(intervals: List[Tuple[float, float]],
+                      points: List[float],
+                      limit: Optional[float] = None
+                      ) -> List[Tuple[float, float]]:
+  """Extends the intervals outwards to the nearest keyframes.
+
+  Start of every interval is moved back to the previous keyframe & end
+  is moved ahead to the next keyframe, so the portions can be extracted
+  using stream copy without losing any of the detected motion.
+
+  Args:
+    intervals: List of start & end (in secs) of the intervals.
+    points: Sorted timestamps (in secs) of the keyframes.
+    limit: Maximum (default: None) value of the end of an interval.
+
+  Returns:
+    Sorted list of non-overlapping keyframe aligned intervals.
+  """
+  if not points:
+    return merge_intervals(intervals, limit=limit)
+  snapped = []
+  for start, end in intervals:
+    idx = bisect.bisect_right(points, start) - 1
+    start = points[max(idx, 0)]
+    idx = bisect.bisect_left(points, end)
+    end = points[idx] if idx < len(points) else (limit or end)
+    snapped.append((start, end))
+  return merge_intervals(snapped, limit=limit)
+
+
+def analysis_frames(file: str,
+                    resize: bool = True,
+                    resize_width: int = 640,
+                    stride: int = 1,
+                    analysis_fps: Optional[float] = None,
+                    keyframes_only: bool = False,
+                    frame_source: str = 'opencv',
+                    start: Optional[float] = None,
+                    end: Optional[float] = None
+                    ) -> Iterator[Tuple[float, float, np.ndarray]]:
+  """Yields the frames of the video selected for analysis.
+
+  With OpenCV, frames which are skipped by the stride are only grabbed
+  & never retrieved or converted. With FFMPEG, skipped frames are
+  dropped inside the decoder & the rest are streamed as grayscale. In
+  keyframe mode (always decoded by FFMPEG), no other frame is decoded.
+
+  Args:
+    file: File to be analyzed.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    stride: Analyze (default: every) Nth frame of the video.
+    analysis_fps: Target FPS (default: None) of analysis, overrides the
+                  stride when set.
+    keyframes_only: Boolean (default: False) value to analyze only the
+                    keyframes (I-frames) of the video.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    start: Starting point (default: None) of the analysis in secs.
+    end: Ending point (default: None) of the analysis in secs.
+
+  Yields:
+    Timestamp (in secs), time span (in secs) covered by the frame and
+    the frame itself.
+  """
+  if keyframes_only or frame_source == 'ffmpeg':
+    source = FFmpegFrameSource(file, resize_width if resize else None, True,
+                               stride, analysis_fps, keyframes_only, start,
+                               end)
+    points = source.timestamps()
+    for idx, (position, frame) in enumerate(source):
+      if points and idx + 1 < len(points):
+        yield position, points[idx + 1] - position, frame
+      else:
+        yield position, 1 / source.fps, frame
+    return
+  stream = cv2.VideoCapture(file)
+  fps = stream.get(cv2.CAP_PROP_FPS) or 25.0
+  if analysis_fps:
+    stride = max(int(round(fps / float(analysis_fps))), 1)
+  stride = max(int(stride), 1)
+  if start:
+    stream.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+  try:
+    idx = 0
+    while True:
+      if idx % stride:
+        if not stream.grab():
+          break
+        idx += 1
+        continue
+      valid_frame, frame = stream.read()
+      if not valid_frame or frame is None:
+        break
+      idx += 1
+      position = stream.get(cv2.CAP_PROP_POS_MSEC) / 1000
+      if end is not None and position >= end:
+        break
+      if resize:
+        frame = rescale(frame, resize_width)
+      yield position, stride / fps, frame
+  finally:
+    stream.release()
+
+
+def _motion_spans(detector: MotionDetector,
+                  frames: Iterator[Tuple[float, float, np.ndarray]],
+                  padding: Union[float, int] = 1.0,
+                  start: float = 0.0,
+                  timeline: Optional[ActivityTimeline] = None
+                  ) -> Tuple[List[Tuple[float, float]], float]:
+  """Returns raw intervals with motion & end of the last analyzed frame.
+
+  Frames before `start` only warm up the detector & are never recorded.
+  """
+  intervals, position, span = [], start, 0.0
+  for position, span, frame in frames:
+    boxes = detector.detect(frame)
+    if not boxes or position < start:
+      continue
+    if timeline is not None:
+      timeline.record(position, boxes)
+    # Frames closer than the padding end up merged anyway, so they are
+    # joined right away to keep the list short for busy videos.
+    if intervals and position - intervals[-1][1] <= 2 * padding:
+      intervals[-1] = (intervals[-1][0], position + span)
+    else:
+      intervals.append((position, position + span))
+  return intervals, position + span
+
+
+def motion_intervals(file: str,
+                     precision: int = 1500,
+                     resize: bool = True,
+                     resize_width: int = 640,
+                     padding: Union[float, int] = 1.0,
+                     stride: int = 1,
+                     analysis_fps: Optional[float] = None,
+                     keyframes_only: bool = False,
+                     frame_source: str = 'opencv',
+                     background: str = 'static',
+                     regions: Optional[List[Polygon]] = None,
+                     exclusions: Optional[List[Polygon]] = None,
+                     prescreen_method: Optional[str] = None,
+                     prescreen_threshold: Optional[float] = None,
+                     timeline: Optional[ActivityTimeline] = None,
+                     log: logging.Logger = None) -> List[Tuple[float, float]]:
+  """Returns intervals (in secs) of the video with detected motion.
+
+  Only the timestamps of the frames with motion are recorded, no frame
+  is written or buffered. With decimation, every analyzed frame stands
+  for the time until the next analyzed frame, so the intervals still map
+  back to the exact timestamps of the video.
+
+  Args:
+    file: File to be analyzed.
+    precision: Minimum contour area (default: 1500) considered motion.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    padding: Time (default: 1 sec) added on both sides of the motion.
+    stride: Analyze (default: every) Nth frame of the video.
+    analysis_fps: Target FPS (default: None) of analysis.
+    keyframes_only: Boolean (default: False) value to analyze only the
+                    keyframes of the video.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    background: Background model (default: static) to be used, either
+                `static`, `running_average`, `mog2` or `knn`.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+    prescreen_method: Method (default: None -> disabled) used to screen
+                      the seconds with activity before analyzing them,
+                      either `mv`, `packets` or `auto`.
+    prescreen_threshold: Minimum activity score (default: None ->
+                         method's default) of the screened seconds.
+    timeline: Activity timeline (default: None) to record the detected
+              motion into.
+    log: Logger object.
+
+  Returns:
+    Sorted list of padded & merged intervals with motion.
+  """
+  log = _log(__file__) if log is None else log
+  if prescreen_method:
+    ranges = prescreen(file, prescreen_method, prescreen_threshold, log=log)
+    log.info(f'Indexing motion for "{os.path.basename(file)}" in '
+             f'{len(ranges)} screened range(s).')
+    intervals, limit, _ = _chunk_motion(file, ranges, 2.0, _motion_options(
+        precision, padding, resize, resize_width, stride, analysis_fps,
+        keyframes_only, frame_source, background, regions, exclusions),
+        timeline)
+    return merge_intervals(intervals, float(padding), limit)
+  log.info(f'Indexing motion for "{os.path.basename(file)}".')
+  intervals, limit = _motion_spans(
+      MotionDetector(precision, background, regions, exclusions),
+      analysis_frames(file, resize, resize_width, stride, analysis_fps,
+                      keyframes_only, frame_source), padding, 0.0, timeline)
+  return merge_intervals(intervals, float(padding), limit)
+
+
+def chunk_ranges(points: List[float],
+                 total: float,
+                 chunks: int) -> List[Tuple[float, Optional[float]]]:
+  """Splits the video into ranges starting at the keyframes.
+
+  Args:
+    points: Sorted timestamps (in secs) of the keyframes.
+    total: Duration (in secs) of the video.
+    chunks: Number of ranges to be made.
+
+  Returns:
+    List of start & end (in secs) of the ranges, end of the last range
+    is None so that it runs till the end of the video.
+  """
+  bounds = [0.0]
+  for idx in range(1, max(int(chunks), 1)):
+    target = total * idx / chunks
+    point = bisect.bisect_left(points, target)
+    # Boundary moves to the keyframe closest to the even split.
+    if point > 0 and (point == len(points) or
+                      target - points[point - 1] < points[point] - target):
+      point -= 1
+    if point < len(points) and points[point] > bounds[-1]:
+      bounds.append(points[point])
+  return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _motion_options(precision: int,
+                    padding: Union[float, int],
+                    resize: bool,
+                    resize_width: int,
+                    stride: int,
+                    analysis_fps: Optional[float],
+                    keyframes_only: bool,
+                    frame_source: str,
+                    background: str,
+                    regions: Optional[List[Polygon]],
+                    exclusions: Optional[List[Polygon]]) -> dict:
+  """Returns options of the detector & frames for `_chunk_motion()`."""
+  return {'precision': precision, 'padding': padding, 'resize': resize,
+          'resize_width': resize_width, 'stride': stride,
+          'analysis_fps': analysis_fps, 'keyframes_only': keyframes_only,
+          'frame_source': frame_source, 'background': background,
+          'regions': regions, 'exclusions': exclusions}
+
+
+def _chunk_motion(file: str,
+                  ranges: List[Tuple[float, Optional[float]]],
+                  warmup: float,
+                  options: dict,
+                  timeline: Optional[ActivityTimeline] = None
+                  ) -> Tuple[List[Tuple[float, float]], float, np.ndarray]:
+  """Index motion for ranges of the video, usually in a worker process."""
+  timeline = ActivityTimeline() if timeline is None else timeline
+  padding = options.pop('padding')
+  detector = MotionDetector(options.pop('precision'),
+                            options.pop('background'),
+                            options.pop('regions'),
+                            options.pop('exclusions'))
+  if ranges and ranges[0][0] > 0 and not detector.model.adaptive:
+    # Static reference is always the first analyzed frame of the video,
+    # so every chunk agrees with the sequential analysis. Adaptive models
+    # settle during the warm-up instead.
+    for _, _, frame in analysis_frames(file, **options):
+      detector.detect(frame)
+      break
+  intervals, limit = [], 0.0
+  for start, end in ranges:
+    frames = analysis_frames(file, **options, start=max(start - warmup, 0.0),
+                             end=end)
+    spans, last = _motion_spans(detector, frames, padding, start, timeline)
+    intervals.extend(spans)
+    limit = max(limit, last)
+  return intervals, limit, timeline.records[:timeline.length]
+
+
+def parallel_motion_intervals(file: str,
+                              precision: int = 1500,
+                              resize: bool = True,
+                              resize_width: int = 640,
+                              padding: Union[float, int] = 1.0,
+                              stride: int = 1,
+                              analysis_fps: Optional[float] = None,
+                              keyframes_only: bool = False,
+                              frame_source: str = 'opencv',
+                              background: str = 'static',
+                              regions: Optional[List[Polygon]] = None,
+                              exclusions: Optional[List[Polygon]] = None,
+                              prescreen_method: Optional[str] = None,
+                              prescreen_threshold: Optional[float] = None,
+                              workers: Optional[int] = None,
+                              warmup: Union[float, int] = 2.0,
+                              timeline: Optional[ActivityTimeline] = None,
+                              log: logging.Logger = None
+                              ) -> List[Tuple[float, float]]:
+  """Returns intervals (in secs) of the video with motion using all cores.
+
+  Video is split at the keyframes into one range per worker & every
+  range is analyzed in a separate process. Each worker decodes `warmup`
+  secs before it's range so the detector settles before the range
+  starts. Intervals of all the ranges are merged into one timeline.
+
+  Args:
+    file: File to be analyzed.
+    precision: Minimum contour area (default: 1500) considered motion.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    padding: Time (default: 1 sec) added on both sides of the motion.
+    stride: Analyze (default: every) Nth frame of the video.
+    analysis_fps: Target FPS (default: None) of analysis.
+    keyframes_only: Boolean (default: False) value to analyze only the
+                    keyframes of the video.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    background: Background model (default: static) to be used, either
+                `static`, `running_average`, `mog2` or `knn`.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+    prescreen_method: Method (default: None -> disabled) used to screen
+                      the seconds with activity before analyzing them,
+                      either `mv`, `packets` or `auto`.
+    prescreen_threshold: Minimum activity score (default: None ->
+                         method's default) of the screened seconds.
+    workers: Number of processes (default: None -> all cores) to use.
+    warmup: Time (default: 2 secs) decoded before every range.
+    timeline: Activity timeline (default: None) to record the detected
+              motion into.
+    log: Logger object.
+
+  Returns:
+    Sorted list of padded & merged intervals with motion.
+  """
+  log = _log(__file__) if log is None else log
+  workers = workers or os.cpu_count() or 1
+  if prescreen_method:
+    # Screened ranges are the chunks, static portions are never decoded.
+    ranges = prescreen(file, prescreen_method, prescreen_threshold, log=log)
+    if not ranges:
+      return []
+  else:
+    ranges = chunk_ranges(keyframes(file), float(duration(file)), workers)
+  log.info(f'Indexing motion for "{os.path.basename(file)}" in '
+           f'{len(ranges)} chunk(s).')
+  options = _motion_options(precision, padding, resize, resize_width, stride,
+                            analysis_fps, keyframes_only, frame_source,
+                            background, regions, exclusions)
+  intervals, limit = [], 0.0
+  with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+    jobs = [pool.submit(_chunk_motion, file, [idx], float(warmup),
+                        dict(options)) for idx in ranges]
+    for job in jobs:
+      spans, end, records = job.result()
+      intervals.extend(spans)
+      limit = max(limit, end)
+      if timeline is not None:
+        timeline.extend(records)
+  return merge_intervals(intervals, float(padding), limit)
+
+
+def extract_motion(file: str,
+                   precision: int = 1500,
+                   resize: bool = True,
+                   resize_width: int = 640,
+                   padding: Union[float, int] = 1.0,
+                   stride: int = 1,
+                   analysis_fps: Optional[float] = None,
+                   keyframes_only: bool = False,
+                   frame_source: str = 'opencv',
+                   background: str = 'static',
+                   regions: Optional[List[Polygon]] = None,
+                   exclusions: Optional[List[Polygon]] = None,
+                   prescreen_method: Optional[str] = None,
+                   prescreen_threshold: Optional[float] = None,
+                   workers: int = 1,
+                   log: logging.Logger = None) -> Optional[str]:
+  """Extract portions of the video with motion using stream copy.
+
+  Unlike `track_motion()`, no frame is re-encoded. Intervals with motion
+  are snapped to the keyframes & extracted from the original video by
+  a single FFMPEG pass, which keeps the original encode quality.
+
+  Args:
+    file: File to be analyzed.
+    precision: Minimum contour area (default: 1500) considered motion.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    padding: Time (default: 1 sec) added on both sides of the motion.
+    stride: Analyze (default: every) Nth frame of the video.
+    analysis_fps: Target FPS (default: None) of analysis.
+    keyframes_only: Boolean (default: False) value to analyze only the
+                    keyframes of the video.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    background: Background model (default: static) to be used, either
+                `static`, `running_average`, `mog2` or `knn`.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+    prescreen_method: Method (default: None -> disabled) used to screen
+                      the seconds with activity before analyzing them,
+                      either `mv`, `packets` or `auto`.
+    prescreen_threshold: Minimum activity score (default: None ->
+                         method's default) of the screened seconds.
+    workers: Number of processes (default: 1) analyzing the video in
+             parallel chunks, 0 uses all the cores.
+    log: Logger object.
+
+  Returns:
+    Path of the extracted video, original file if there's no motion.
+  """
+  log = _log(__file__) if log is None else log
+  directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}')
+  if not os.path.isdir(directory):
+    os.mkdir(directory)
+  temp_file = os.path.join(directory, f'{Path(file).stem}_motion.mp4')
+  timeline = ActivityTimeline()
+  try:
+    if workers == 1:
+      intervals = motion_intervals(file, precision, resize, resize_width,
+                                   padding, stride, analysis_fps,
+                                   keyframes_only, frame_source, background,
+                                   regions, exclusions, prescreen_method,
+                                   prescreen_threshold, timeline, log)
+    else:
+      intervals = parallel_motion_intervals(file, precision, resize,
+                                            resize_width, padding, stride,
+                                            analysis_fps, keyframes_only,
+                                            frame_source, background,
+                                            regions, exclusions,
+                                            prescreen_method,
+                                            prescreen_threshold,
+                                            workers or None,
+                                            timeline=timeline, log=log)
+    timeline.save(timeline_path(file))
+    if not intervals:
+      return file
+    intervals = snap_to_keyframes(intervals, keyframes(file))
+    with open(os.path.join(directory, f'{Path(file).stem}.csv'), 'a',
+              encoding=dev.DEF_CHARSET) as csv_file:
+      log.info('Logging motion intervals into a CSV file.')
+      _file = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
+      _file.writerow(['Start', 'End'])
+      _file.writerows([(s2d(int(start)), s2d(int(end)))
+                       for start, end in intervals])
+    log.info(f'Extracting {len(intervals)} portion(s) of video with '
+             'detected motion.')
+    return concate_intervals(file, intervals, temp_file)
+  except Exception as error:
+    log.critical(f'Something went wrong because of {error}')
@@ -0,0 +1,310 @@
+"""A subservice for running multiple analyzers over a single decode."""
+
+import csv
+import logging
+import os
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from video_processing_engine.core.detect.background import Polygon
+from video_processing_engine.core.detect.motion import MotionDetector
+from video_processing_engine.core.detect.sources import open_source
+from video_processing_engine.core.process.encoder import FFmpegWriter
+from video_processing_engine.core.redact.faces import (detect_faces,
+                                                       redact_regions)
+from video_processing_engine.utils.common import seconds_to_datetime as s2d
+from video_processing_engine.utils.logs import log as _log
+from video_processing_engine.utils.opencvapi import draw_bounding_box
+from video_processing_engine.vars import color, dev
+
+
+class FrameAnalyzer(object):
+  """Base class of the analyzers chained in the frame pipeline.
+
+  Analyzers marked as `gate` are run on every decoded frame & decide if
+  the frame (along with the buffered frames around it) needs to be kept.
+  Rest of the analyzers are run only on the frames which are written to
+  the output, in the order they are chained.
+  """
+  gate = False
+
+  def process(self,
+              frame: np.ndarray,
+              timestamp: Union[float, int],
+              meta: Dict) -> bool:
+    """Process the frame in place & return True if it should be kept.
+
+    Args:
+      frame: Numpy array of the BGR image frame.
+      timestamp: Position of the frame in the video in msecs.
+      meta: Dictionary shared by all the analyzers for this frame.
+    """
+    return True
+
+  def finish(self) -> None:
+    """Called once after the last frame has been processed."""
+    pass
+
+
+class MotionGate(FrameAnalyzer):
+  """Keeps only the frames around the detected motion.
+
+  Args:
+    precision: Minimum contour area (default: 1500) considered motion.
+    background: Background model (default: static) to be used.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+  """
+  gate = True
+
+  def __init__(self,
+               precision: int = 1500,
+               background: str = 'static',
+               regions: Optional[List[Polygon]] = None,
+               exclusions: Optional[List[Polygon]] = None) -> None:
+    super(MotionGate, self).__init__()
+    self.detector = MotionDetector(precision, background, regions,
+                                   exclusions)
+
+  def process(self,
+              frame: np.ndarray,
+              timestamp: Union[float, int],
+              meta: Dict) -> bool:
+    boxes = self.detector.detect(frame)
+    meta['motion'] = boxes or []
+    return bool(boxes)
+
+
+class FaceRedactor(FrameAnalyzer):
+  """Redacts faces in the frame.
+
+  Args:
+    use_ml_model: Boolean (default: True) value to use MTCNN instead of
+                  Haar cascade.
+    smooth_blur: Boolean (default: True) value to blur the faces instead
+                 of pixelating them.
+    backend: Detector (default: None -> as per `use_ml_model`) to be
+             used, either `mtcnn`, `dnn` or `haar`.
+    report: Path (default: None) of the CSV file where the maximum
+            number of detections per second are logged, same as
+            `redact_faces()`.
+  """
+
+  def __init__(self,
+               use_ml_model: bool = True,
+               smooth_blur: bool = True,
+               backend: Optional[str] = None,
+               report: Optional[str] = None) -> None:
+    super(FaceRedactor, self).__init__()
+    self.use_ml_model = use_ml_model
+    self.smooth_blur = smooth_blur
+    self.backend = backend
+    self.report = report
+    self.face_count = {}
+
+  def process(self,
+              frame: np.ndarray,
+              timestamp: Union[float, int],
+              meta: Dict) -> bool:
+    faces = detect_faces(frame, self.use_ml_model, backend=self.backend)
+    redact_regions(frame, faces, self.smooth_blur)
+    if faces:
+      occurence = s2d(int(timestamp / 1000))
+      self.face_count[occurence] = max(self.face_count.get(occurence, 0),
+                                       len(faces))
+    meta['faces'] = faces
+    return True
+
+  def finish(self) -> None:
+    if self.report is None:
+      return
+    with open(self.report, 'a', encoding=dev.DEF_CHARSET) as csv_file:
+      _file = csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL)
+      _file.writerow(['Max no. of detections per second', 'Time frame'])
+      _file.writerows([(count, occurence)
+                       for occurence, count in self.face_count.items()])
+
+
+class Overlay(FrameAnalyzer):
+  """Draws detections reported by the previous analyzers on the frame."""
+
+  def process(self,
+              frame: np.ndarray,
+              timestamp: Union[float, int],
+              meta: Dict) -> bool:
+    for (x0, y0, x1, y1) in meta.get('motion', []):
+      draw_bounding_box(frame, (x0, y0), (x0 + x1, y0 + y1))
+    for box in meta.get('faces', []):
+      draw_bounding_box(frame, box[:2], box[2:], color.red)
+    return True
+
+
+class FramePipeline(object):
+  """Decodes the video once & feeds every frame to chained analyzers.
+
+  All the analyzers share one decode, one rescale & one encoder. When a
+  gate analyzer is chained, frames are buffered so that `buffer_size`
+  frames before & after the gated portion are written as well.
+
+  Args:
+    analyzers: Analyzers to be run in the order of the chain.
+    buffer_size: Number of frames (default: 32) kept around the gate.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    log: Logger object.
+  """
+
+  def __init__(self,
+               analyzers: List[FrameAnalyzer],
+               buffer_size: int = 32,
+               resize: bool = True,
+               resize_width: int = 640,
+               frame_source: str = 'opencv',
+               log: logging.Logger = None) -> None:
+    super(FramePipeline, self).__init__()
+    self.gates = [idx for idx in analyzers if idx.gate]
+    self.stages = [idx for idx in analyzers if not idx.gate]
+    self.buffer_size = buffer_size
+    self.resize = resize
+    self.resize_width = resize_width
+    self.frame_source = frame_source
+    self.log = _log(__file__) if log is None else log
+    self.frames_read = 0
+    self.frames_written = 0
+
+  def run(self, file: str, output: str) -> Optional[str]:
+    """Run the analyzers over the video & write the kept frames.
+
+    Args:
+      file: Video file to be analyzed.
+      output: Path of the output file.
+
+    Returns:
+      Path of the output file, None if no frame was kept.
+    """
+    # Buffered frames must outlive the reused buffers of FFMPEG source.
+    source = open_source(file, self.frame_source, self.resize,
+                         self.resize_width, ring_size=self.buffer_size + 2)
+    fps = source.fps
+    save = None
+    buffered = deque(maxlen=self.buffer_size)
+    post_frames = 0
+
+    def emit(frame: np.ndarray, timestamp: float, meta: Dict) -> None:
+      nonlocal save
+      for stage in self.stages:
+        stage.process(frame, timestamp, meta)
+      if save is None:
+        save = FFmpegWriter(output, fps, (frame.shape[1], frame.shape[0]))
+      save.write(frame)
+      self.frames_written += 1
+
+    try:
+      for position, frame in source:
+        timestamp = position * 1000
+        self.frames_read += 1
+        meta = {}
+        if not self.gates:
+          emit(frame, timestamp, meta)
+          continue
+        # Every gate needs to see every frame to keep it's own state.
+        keep = [gate.process(frame, timestamp, meta) for gate in self.gates]
+        if all(keep):
+          while buffered:
+            emit(*buffered.popleft())
+          emit(frame, timestamp, meta)
+          post_frames = self.buffer_size
+        elif post_frames > 0:
+          emit(frame, timestamp, meta)
+          post_frames -= 1
+        else:
+          buffered.append((frame, timestamp, meta))
+    finally:
+      for analyzer in self.gates + self.stages:
+        analyzer.finish()
+      if save is not None:
+        save.release()
+
+    self.log.info(f'Wrote {self.frames_written}/{self.frames_read} frames '
+                  'after analysis.')
+    if save is None:
+      return None
+    return output
+
+
+def analyze(file: str,
+            motion: bool = True,
+            face: bool = True,
+            precision: int = 1500,
+            use_ml_model: bool = True,
+            smooth_blur: bool = True,
+            resize: bool = True,
+            resize_width: int = 640,
+            debug_mode: bool = False,
+            frame_source: str = 'opencv',
+            background: str = 'static',
+            regions: Optional[List[Polygon]] = None,
+            exclusions: Optional[List[Polygon]] = None,
+            backend: Optional[str] = None,
+            log: logging.Logger = None) -> Optional[str]:
+  """Analyze motion & redact faces in the video in a single pass.
+
+  Only the frame-wise motion detection & the default face detector
+  settings are supported, use `track_motion()` / `extract_motion()` &
+  `redact_faces()` separately for the rest. Like `redact_faces()`, the
+  faces detected per second are logged into a CSV file.
+
+  Args:
+    file: Video file to be analyzed.
+    motion: Boolean (default: True) value to keep only the frames with
+            detected motion.
+    face: Boolean (default: True) value to redact the faces.
+    precision: Minimum contour area (default: 1500) considered motion.
+    use_ml_model: Boolean (default: True) value to use MTCNN instead of
+                  Haar cascade.
+    smooth_blur: Boolean (default: True) value to blur the faces instead
+                 of pixelating them.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    debug_mode: Boolean (default: False) value to draw the detections.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    background: Background model (default: static) to be used, either
+                `static`, `running_average`, `mog2` or `knn`.
+    regions: Polygons (default: None -> whole frame) to be analyzed.
+    exclusions: Polygons (default: None) to be ignored.
+    backend: Face detector (default: None -> as per `use_ml_model`) to
+             be used, either `mtcnn`, `dnn` or `haar`.
+    log: Logger object.
+
+  Returns:
+    Path of the analyzed video.
+  """
+  log = _log(__file__) if log is None else log
+  analyzers = []
+  if motion:
+    analyzers.append(MotionGate(precision, background, regions, exclusions))
+  directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}')
+  if not os.path.isdir(directory):
+    os.mkdir(directory)
+
+  if face:
+    analyzers.append(FaceRedactor(use_ml_model, smooth_blur, backend,
+                                  os.path.join(directory,
+                                               f'{Path(file).stem}.csv')))
+  if debug_mode:
+    log.info('Debug mode - Enabled.')
+    analyzers.append(Overlay())
+  output = os.path.join(directory, f'{Path(file).stem}_analyzed.mp4')
+
+  log.info(f'Analyzing "{os.path.basename(file)}" in a single pass.')
+  try:
+    return FramePipeline(analyzers, resize=resize, resize_width=resize_width,
+                         frame_source=frame_source, log=log).run(file, output)
+  except Exception as error:
+    log.critical(f'Something went wrong because of {error}')
@@ -0,0 +1,196 @@
+"""A subservice for screening activity in videos without decoding pixels."""
+
+import logging
+import os
+import subprocess
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from video_processing_engine.utils.logs import log as _log
+
+try:
+  import av
+except ImportError:
+  av = None
+
+# Default thresholds of the scores reported by the screening methods.
+MV_THRESHOLD = 0.01
+PACKET_THRESHOLD = 0.05
+
+
+def mv_scores(file: str) -> np.ndarray:
+  """Returns fraction of the frame moving in every second of the video.
+
+  Motion vectors are exported by the H.264 decoder (`+export_mvs`) as
+  side data & read through PyAV. Frames are never converted, rescaled
+  or handed to OpenCV, only the vectors are summed up. Score of every
+  second is the largest area (relative to the frame) covered by the
+  blocks which moved by at least a pixel.
+
+  Notes:
+    The vectors are only exported while decoding, so this costs a full
+    decode of the video (without any conversion) on top of the motion
+    detection. `prescreen()` logs the time it takes. Use it only when
+    the packet sizes are too coarse.
+
+  Args:
+    file: File to be screened.
+
+  Returns:
+    Numpy array of scores indexed by seconds of the video.
+  """
+  scores = {}
+  with av.open(file) as container:
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO'
+    stream.codec_context.options = {'flags2': '+export_mvs'}
+    area = float(stream.codec_context.width * stream.codec_context.height)
+    for frame in container.decode(stream):
+      if frame.time is None:
+        continue
+      vectors = frame.side_data.get('MOTION_VECTORS')
+      score = 0.0
+      if vectors is not None and len(vectors):
+        mvs = vectors.to_ndarray()
+        scale = np.maximum(mvs['motion_scale'], 1)
+        moved = ((np.abs(mvs['motion_x']) >= scale) |
+                 (np.abs(mvs['motion_y']) >= scale))
+        score = float(np.sum(mvs['w'][moved].astype(np.float64) *
+                             mvs['h'][moved])) / area
+      second = int(frame.time)
+      scores[second] = max(scores.get(second, 0.0), score)
+  return _to_array(scores)
+
+
+def packet_scores(file: str) -> np.ndarray:
+  """Returns relative size of the predicted frames in every second.
+
+  Predicted frames of a static scene barely carry any data, so the size
+  of the non-keyframe packets follows the amount of change in the scene.
+  Every packet is measured against the keyframe of it's own GOP, which
+  cancels out the detail of the scene & the bitrate of the camera, and
+  the score of every second is the mean of it's packets. Unlike scores
+  relative to the other seconds, busy footage isn't judged against it's
+  own busy seconds. The video is only demuxed using FFPROBE.
+
+  Args:
+    file: File to be screened.
+
+  Returns:
+    Numpy array of scores indexed by seconds of the video.
+  """
+  output = subprocess.check_output(['ffprobe', '-v', 'error',
+                                    '-select_streams', 'v:0', '-show_entries',
+                                    'packet=pts_time,size,flags', '-of',
+                                    'csv=p=0', file])
+  totals, counts, keyframe = {}, {}, 0
+  # Packets are listed in decoding order, so every GOP's keyframe comes
+  # before it's predicted frames.
+  for line in output.decode().splitlines():
+    pts_time, size, flags = (line.split(',') + ['', ''])[:3]
+    if pts_time in ('', 'N/A') or not size.isdigit():
+      continue
+    if 'K' in flags:
+      keyframe = int(size)
+      continue
+    if not keyframe:
+      continue
+    second = int(float(pts_time))
+    totals[second] = totals.get(second, 0.0) + int(size) / keyframe
+    counts[second] = counts.get(second, 0) + 1
+  return _to_array({second: total / counts[second]
+                    for second, total in totals.items()})
+
+
+def _to_array(scores: dict) -> np.ndarray:
+  """Returns array of the per second scores, missing seconds are 0."""
+  array = np.zeros(max(scores) + 1 if scores else 0, np.float32)
+  for second, score in scores.items():
+    array[second] = score
+  return array
+
+
+def activity_scores(file: str,
+                    method: str = 'auto',
+                    log: logging.Logger = None) -> Tuple[np.ndarray, str]:
+  """Returns per second activity scores of the video.
+
+  Args:
+    file: File to be screened.
+    method: Screening method (default: auto), either `mv`, `packets` or
+            `auto` which uses the packet sizes as they need no decoding.
+    log: Logger object.
+
+  Returns:
+    Numpy array of scores & the method used for scoring them.
+  """
+  log = _log(__file__) if log is None else log
+  if method == 'mv' and av is not None:
+    try:
+      return mv_scores(file), 'mv'
+    except Exception as error:
+      log.warning(f'Motion vectors unavailable because of {error}.')
+  elif method == 'mv':
+    log.warning('PyAV is not installed, using packet sizes instead.')
+  return packet_scores(file), 'packets'
+
+
+def active_ranges(scores: np.ndarray,
+                  threshold: float,
+                  padding: int = 1) -> List[Tuple[float, float]]:
+  """Returns ranges (in secs) where the scores are above the threshold.
+
+  Args:
+    scores: Per second activity scores.
+    threshold: Minimum score considered activity.
+    padding: Seconds (default: 1) added on both sides of the activity.
+
+  Returns:
+    Sorted list of non-overlapping ranges.
+  """
+  active = np.flatnonzero(scores > threshold)
+  ranges = []
+  for second in active:
+    start = max(int(second) - padding, 0)
+    end = min(int(second) + 1 + padding, len(scores))
+    if ranges and start <= ranges[-1][1]:
+      ranges[-1] = (ranges[-1][0], end)
+    else:
+      ranges.append((start, end))
+  return [(float(start), float(end)) for start, end in ranges]
+
+
+def prescreen(file: str,
+              method: str = 'auto',
+              threshold: Optional[float] = None,
+              padding: int = 1,
+              log: logging.Logger = None) -> List[Tuple[float, float]]:
+  """Returns ranges of the video worth analyzing at the pixel level.
+
+  Args:
+    file: File to be screened.
+    method: Screening method (default: auto), either `mv`, `packets` or
+            `auto`.
+    threshold: Minimum score (default: None -> method's default)
+               considered activity.
+    padding: Seconds (default: 1) added on both sides of the activity.
+    log: Logger object.
+
+  Returns:
+    Sorted list of ranges (in secs) with activity.
+  """
+  log = _log(__file__) if log is None else log
+  log.info(f'Pre-screening activity for "{os.path.basename(file)}".')
+  started = time.time()
+  scores, method = activity_scores(file, method, log)
+  log.info(f'Pre-screening using {method} took '
+           f'{time.time() - started:.2f} secs.')
+  if threshold is None:
+    threshold = MV_THRESHOLD if method == 'mv' else PACKET_THRESHOLD
+  ranges = active_ranges(scores, threshold, padding)
+  active = sum(end - start for start, end in ranges)
+  log.info(f'Pre-screening kept {active:.0f}/{len(scores)} secs using '
+           f'{method}.')
+  return ranges
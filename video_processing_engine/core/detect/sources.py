@@ -0,0 +1,232 @@
+"""A subservice for decoding frames of the videos for the analyzers."""
+
+import subprocess
+from typing import Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from video_processing_engine.core.process.keyframes import keyframes
+from video_processing_engine.utils.opencvapi import rescale
+
+
+def _scaled_size(file: str,
+                 width: Optional[int] = None) -> Tuple[float, int, int]:
+  """Returns FPS & size of the video after rescaling it to the width."""
+  stream = cv2.VideoCapture(file)
+  fps = stream.get(cv2.CAP_PROP_FPS) or 25.0
+  frame_width = int(stream.get(cv2.CAP_PROP_FRAME_WIDTH))
+  frame_height = int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT))
+  stream.release()
+  if width is None or frame_width == 0:
+    return fps, frame_width, frame_height
+  # Same rounding as `rescale()` so that both the sources agree.
+  return fps, width, int(frame_height * (width / float(frame_width)))
+
+
+def _read_exact(pipe, view: memoryview) -> bool:
+  """Fill the view from the pipe, returns False on end of the stream."""
+  filled = 0
+  while filled < len(view):
+    count = pipe.readinto(view[filled:])
+    if not count:
+      return False
+    filled += count
+  return True
+
+
+class OpenCVFrameSource(object):
+  """Decodes frames using OpenCV & rescales them in Python.
+
+  Args:
+    file: File to be decoded.
+    width: Width (default: None -> original) of the frames.
+    gray: Boolean (default: False) value to yield grayscale frames.
+    start: Starting point (default: None) of the video in secs.
+    end: Ending point (default: None) of the video in secs.
+  """
+
+  def __init__(self,
+               file: str,
+               width: Optional[int] = None,
+               gray: bool = False,
+               start: Optional[float] = None,
+               end: Optional[float] = None) -> None:
+    super(OpenCVFrameSource, self).__init__()
+    self.file = file
+    self.gray = gray
+    self.start = start
+    self.end = end
+    self.scale_width = width
+    self.fps, self.width, self.height = _scaled_size(file, width)
+
+  def __iter__(self) -> Iterator[Tuple[float, np.ndarray]]:
+    stream = cv2.VideoCapture(self.file)
+    if self.start:
+      stream.set(cv2.CAP_PROP_POS_MSEC, self.start * 1000)
+    try:
+      while True:
+        valid_frame, frame = stream.read()
+        if not valid_frame or frame is None:
+          break
+        position = stream.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if self.end is not None and position >= self.end:
+          break
+        if self.scale_width:
+          frame = rescale(frame, self.scale_width)
+        if self.gray:
+          frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        yield position, frame
+    finally:
+      stream.release()
+
+
+class FFmpegFrameSource(object):
+  """Decodes & rescales frames using FFMPEG & streams them over a pipe.
+
+  Scaling & pixel format conversion happen inside FFMPEG's multithreaded
+  decoder. Python receives fixed-size rawvideo frames which are read
+  straight into preallocated buffers & yielded as Numpy views without
+  copying them.
+
+  Args:
+    file: File to be decoded.
+    width: Width (default: None -> original) of the frames.
+    gray: Boolean (default: False) value to yield grayscale frames.
+    stride: Decode (default: every) Nth frame of the video, or every Nth
+            keyframe in keyframe mode.
+    fps: Target FPS (default: None) of the frames, overrides stride. Not
+         supported in keyframe mode as keyframes are not evenly spaced.
+    keyframes_only: Boolean (default: False) value to decode only the
+                    keyframes of the video.
+    start: Starting point (default: None) of the video in secs.
+    end: Ending point (default: None) of the video in secs.
+    ring_size: Number of buffers (default: 2) cycled by the source.
+    threads: Number of decoder threads (default: 0 -> auto).
+
+  Notes:
+    Yielded frames are views over a ring of `ring_size` buffers. A frame
+    stays valid only until `ring_size` more frames have been read, so
+    consumers holding on to the frames must either copy them or ask for
+    a large enough ring.
+  """
+
+  def __init__(self,
+               file: str,
+               width: Optional[int] = None,
+               gray: bool = False,
+               stride: int = 1,
+               fps: Optional[float] = None,
+               keyframes_only: bool = False,
+               start: Optional[float] = None,
+               end: Optional[float] = None,
+               ring_size: int = 2,
+               threads: int = 0) -> None:
+    super(FFmpegFrameSource, self).__init__()
+    if keyframes_only and fps:
+      raise ValueError('Target FPS is not supported while decoding only '
+                       'the keyframes, use stride instead.')
+    self.file = file
+    self.gray = gray
+    self.stride = max(int(stride), 1)
+    self.keyframes_only = keyframes_only
+    self.start = start
+    self.end = end
+    self.ring_size = max(int(ring_size), 1)
+    self.threads = threads
+    native_fps, self.width, self.height = _scaled_size(file, width)
+    self.fps = float(fps) if fps else native_fps / self.stride
+    self.target_fps = fps
+    self.channels = 1 if gray else 3
+    self._points = None
+
+  @property
+  def shape(self) -> Tuple[int, ...]:
+    """Shape of the yielded frames."""
+    if self.channels == 1:
+      return (self.height, self.width)
+    return (self.height, self.width, self.channels)
+
+  def command(self) -> List[str]:
+    """Returns FFMPEG command streaming the rawvideo frames."""
+    args = ['ffmpeg', '-loglevel', 'error', '-threads', str(self.threads)]
+    if self.keyframes_only:
+      args += ['-skip_frame', 'nokey']
+    if self.start:
+      args += ['-ss', str(self.start)]
+    args += ['-i', self.file]
+    if self.end is not None:
+      args += ['-t', str(self.end - (self.start or 0))]
+    filters = []
+    if self.target_fps:
+      filters.append(f'fps={self.target_fps}')
+    elif self.stride > 1:
+      filters.append(f'select=not(mod(n\\,{self.stride}))')
+    filters.append(f'scale={self.width}:{self.height}:flags=area')
+    return args + ['-an', '-vsync', '0', '-vf', ','.join(filters), '-f',
+                   'rawvideo', '-pix_fmt', 'gray' if self.gray else 'bgr24',
+                   '-']
+
+  def timestamps(self) -> Union[List[float], None]:
+    """Returns timestamps of the keyframes within the range, if needed."""
+    if not self.keyframes_only:
+      return None
+    if self._points is None:
+      start = self.start or 0.0
+      self._points = [idx for idx in keyframes(self.file)
+                      if idx >= start and (self.end is None or idx < self.end)]
+      # Decimated the same way as the keyframes by the select filter.
+      self._points = self._points[::self.stride]
+    return self._points
+
+  def __iter__(self) -> Iterator[Tuple[float, np.ndarray]]:
+    frame_size = self.width * self.height * self.channels
+    ring = [bytearray(frame_size) for _ in range(self.ring_size)]
+    views = [np.frombuffer(idx, np.uint8).reshape(self.shape) for idx in ring]
+    points = self.timestamps()
+    process = subprocess.Popen(self.command(), stdout=subprocess.PIPE,
+                               bufsize=frame_size)
+    try:
+      idx = 0
+      while points is None or idx < len(points):
+        slot = idx % self.ring_size
+        if not _read_exact(process.stdout, memoryview(ring[slot])):
+          break
+        if points is None:
+          position = (self.start or 0.0) + idx / self.fps
+        else:
+          position = points[idx]
+        yield position, views[slot]
+        idx += 1
+    finally:
+      process.stdout.close()
+      process.kill()
+      process.wait()
+
+
+def open_source(file: str,
+                frame_source: str = 'opencv',
+                resize: bool = True,
+                resize_width: int = 640,
+                gray: bool = False,
+                ring_size: int = 2,
+                **kwargs) -> Union[OpenCVFrameSource, FFmpegFrameSource]:
+  """Returns frame source for the analyzers.
+
+  Args:
+    file: File to be decoded.
+    frame_source: Decoder (default: opencv) to be used, either `opencv`
+                  or `ffmpeg`.
+    resize: Boolean (default: True) value to rescale the frames.
+    resize_width: Width (default: 640) of the rescaled frames.
+    gray: Boolean (default: False) value to yield grayscale frames.
+    ring_size: Number of buffers (default: 2) used by FFMPEG source.
+    kwargs: Other options supported by the selected source.
+
+  Returns:
+    Iterable source of timestamp (in secs) & frame.
+  """
+  width = resize_width if resize else None
+  if frame_source == 'ffmpeg':
+    return FFmpegFrameSource(file, width, gray, ring_size=ring_size, **kwargs)
+  return OpenCVFrameSource(file, width, gray, **kwargs)
@@ -0,0 +1,117 @@
+"""A subservice for recording motion activity of the videos."""
+
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Activity of every second of the video: timestamp (in secs), number of
+# bounding boxes detected & sum of their areas (in pixels).
+ACTIVITY = np.dtype([('timestamp', np.float32),
+                     ('boxes', np.uint32),
+                     ('area', np.float64)])
+
+
+def timeline_path(file: str) -> str:
+  """Returns path of the activity timeline of the video."""
+  return os.path.join(os.path.dirname(file), f'{Path(file).stem}',
+                      f'{Path(file).stem}_activity.npy')
+
+
+class ActivityTimeline(object):
+  """Per second activity of the video stored as a structured array.
+
+  Every analyzed frame only bumps the counters of it's second, so a busy
+  8 hour video costs 28,800 fixed-size records instead of a string per
+  detected contour.
+
+  Args:
+    seconds: Expected duration (default: 0) of the video in secs, the
+             timeline grows if the video runs longer.
+  """
+
+  def __init__(self, seconds: Union[float, int] = 0) -> None:
+    super(ActivityTimeline, self).__init__()
+    self.records = np.zeros(max(int(seconds) + 1, 1), ACTIVITY)
+    self.records['timestamp'] = np.arange(len(self.records))
+    self.length = 0
+
+  def record(self,
+             timestamp: Union[float, int],
+             boxes: Sequence[Tuple[int, int, int, int]]) -> None:
+    """Add bounding boxes (x, y, w, h) detected at the timestamp (secs)."""
+    second = int(timestamp)
+    if second >= len(self.records):
+      grown = np.zeros(max(second + 1, 2 * len(self.records)), ACTIVITY)
+      grown[:len(self.records)] = self.records
+      grown['timestamp'][len(self.records):] = np.arange(len(self.records),
+                                                         len(grown))
+      self.records = grown
+    self.length = max(self.length, second + 1)
+    if boxes:
+      self.records['boxes'][second] += len(boxes)
+      self.records['area'][second] += sum(w * h for _, _, w, h in boxes)
+
+  def extend(self, records: np.ndarray) -> None:
+    """Add activity recorded separately, like by the worker processes."""
+    if len(records) == 0:
+      return
+    self.record(records['timestamp'][-1], [])
+    self.records['boxes'][:len(records)] += records['boxes']
+    self.records['area'][:len(records)] += records['area']
+
+  def save(self, path: str) -> str:
+    """Save the timeline as a `.npy` file & return it's path."""
+    np.save(path, self.records[:self.length])
+    return path
+
+
+def load_timeline(path: str) -> np.ndarray:
+  """Returns memory mapped activity timeline saved at the path."""
+  return np.load(path, mmap_mode='r')
+
+
+def busiest_windows(timeline: Union[np.ndarray, str],
+                    window: Union[float, int] = 30,
+                    count: int = 1,
+                    key: str = 'area') -> List[Tuple[float, float, float]]:
+  """Returns non-overlapping windows with the most activity.
+
+  Args:
+    timeline: Activity timeline or path of the saved timeline.
+    window: Length (default: 30 secs) of every window.
+    count: Maximum number (default: 1) of windows to be returned.
+    key: Field (default: area) of activity to be compared, either `area`
+         or `boxes`.
+
+  Returns:
+    List of start, end (in secs) & total activity of the windows, the
+    busiest first.
+  """
+  if isinstance(timeline, str):
+    timeline = load_timeline(timeline)
+  window = max(int(window), 1)
+  if len(timeline) == 0:
+    return []
+  if len(timeline) <= window:
+    return [(0.0, float(len(timeline)), float(timeline[key].sum()))]
+  totals = np.cumsum(np.concatenate(([0.0], timeline[key])))
+  sums = totals[window:] - totals[:-window]
+  windows = []
+  for start in np.argsort(sums)[::-1]:
+    if len(windows) == count or sums[start] <= 0:
+      break
+    if all(abs(int(start) - idx) >= window for idx, _, _ in windows):
+      windows.append((int(start), int(start) + window, float(sums[start])))
+  return [(float(start), float(end), total) for start, end, total in windows]
+
+
+def activity_ratio(timeline: Union[np.ndarray, str],
+                   start: Optional[float] = None,
+                   end: Optional[float] = None) -> float:
+  """Returns fraction of the seconds with activity in the range."""
+  if isinstance(timeline, str):
+    timeline = load_timeline(timeline)
+  portion = timeline[int(start or 0):None if end is None else int(end)]
+  return float(np.count_nonzero(portion['boxes'])) / max(len(portion), 1)
@@ -1,82 +1,55 @@
-import json
-import threading
-import time
+import asyncio
 from uuid import uuid4
-from datetime import timedelta
 
-from video_processing_engine.core.bugsbunny import log, now, spin, phase_one
+from video_processing_engine.core.bugsbunny import log
+from video_processing_engine.core.capture.liveness import LivenessProber
+from video_processing_engine.core.capture.scheduler import Job, Scheduler
+from video_processing_engine.core.capture.supervisor import CaptureSupervisor
 
 _log = log(__file__)
 
 
-class SpawnTheSheep(object):
+def sheep(supervisor: CaptureSupervisor, job: Job) -> None:
+  """Sheep callback fired by the scheduler when the order is due.
 
-  def __init__(self):
-    super(SpawnTheSheep, self).__init__()
-    self.active = []
-    self.lock = threading.Lock()
-
-  def spawn(self, name: str):
-    with self.lock:
-      self.active.append(name)
-
-  def despawn(self, name: str):
-    with self.lock:
-      self.active.remove(name)
-
-
-def sheep(threads: threading.Semaphore, json_obj: dict) -> None:
-  """Sheep thread object.
-  
   Args:
-    threads: Thread semaphore object (thread count).
-    json_obj: JSON dictionary which Admin sends to VPE.
+    supervisor: Capture supervisor running all the recordings.
+    job: Scheduled job carrying the JSON dictionary which Admin sends to
+         VPE as it's payload.
   """
-  with threads:
-    name = threading.currentThread().getName()
-    pool.spawn(name)
-    update_time = None
+  _log.info(f'Video processing engine started {job.name} for '
+            f'{job.run_date}.')
+  supervisor.submit(job.name, job.payload, job.run_date)
 
-    try:
-      run_date = now().strftime('%Y-%m-%d')
-      while True:
-        start_time = json_obj['start_time']
-        timezone = json_obj.get('camera_timezone', 'UTC')
-        start_time = update_time if update_time else start_time
-        _start_time = f'{run_date} {start_time}'
-        _log.info('Video processing engine is scheduled to start '
-                  f'at {_start_time}.')
 
-        while True:
-          if str(now()) == str(_start_time):
-            # spin(json.dumps(json_obj), run_date, now(), _log)
-            phase_one(json.dumps(json_obj), run_date, now(), _log)
-            _log.info('Updating next run cycle.')
-            run_date = now() + timedelta(days=1)
-            run_date = run_date.strftime('%Y-%m-%d')
-            update_time = None
-            break
-
-          time.sleep(1.0)
-    except KeyboardInterrupt:
-      _log.error('Video processing engine sheep interrupted.')
-      pool.despawn(name)
-    except Exception as _error:
-      _log.exception(_error)
-    finally:
-      pool.despawn(name)
+async def herd(orders: list) -> None:
+  """Schedule all the orders & run them in a single event loop."""
+  prober = LivenessProber(log=_log)
+  supervisor = CaptureSupervisor(prober=prober, log=_log)
+  scheduler = Scheduler(log=_log)
+  for idx in orders:
+    prober.register(idx['camera_address'], idx.get('camera_port', 554))
+    agl = ''.join([str(idx['customer_id']), str(idx['area_code']),
+                   str(idx['camera_id']), str(uuid4())[:8]])
+    scheduler.schedule(Job(f'order_{agl}',
+                           lambda job: sheep(supervisor, job),
+                           idx['start_time'],
+                           idx.get('camera_timezone', 'UTC'),
+                           payload=idx,
+                           timestamp_format=idx.get('timestamp_format',
+                                                    '%H:%M:%S')))
+  probing = asyncio.ensure_future(prober.run())
+  try:
+    await scheduler.arun()
+  finally:
+    probing.cancel()
+    await supervisor.shutdown()
 
-pool = SpawnTheSheep()
-threads = threading.Semaphore(2000)
 
 orders = []
 
-while True:
-  for idx in orders:
-    agl = ''.join([idx['customer_id'], idx['area_code'],
-                  idx['camera_id'], str(uuid4())[:8]])
-    t = threading.Thread(target=sheep, name=f'order_{agl}',
-                         args=(threads, idx))
-    t.start()
-  else:
-    orders.append('New value')
+if __name__ == '__main__':
+  try:
+    asyncio.run(herd(orders))
+  except KeyboardInterrupt:
+    _log.error('Video processing engine sheep interrupted.')
@@ -1,7 +1,8 @@
 """A subservice for concatenating the videos."""
 
 import os
-from typing import Optional
+import subprocess
+from typing import List, Optional, Tuple
 
 from video_processing_engine.core.process.stats import duration as drn
 from video_processing_engine.core.process.stats import video_file_extensions
@@ -54,3 +55,89 @@ def concate_videos(directory: str,
     for file in temp:
       os.remove(file)
   return output
+
+
+def concate_files(files: List[str],
+                  output: str,
+                  delete_old_files: bool = True) -> Optional[str]:
+  """Concatenates the listed videos in the given order.
+
+  Unlike `concate_videos()`, this function does not scan a directory
+  or sort by creation time. The files are joined exactly in the order
+  they are passed using FFMPEG's concat demuxer with stream copy.
+
+  Args:
+    files: Ordered list of files to be concatenated.
+    output: Path of the output file.
+    delete_old_files: Boolean (default: True) value to delete the older
+                      files once the concatenation is done.
+
+  Returns:
+    Path where the concatenated file is created, None if FFMPEG failed.
+    Input files are only deleted once the output is written.
+  """
+  files = [file for file in files if os.path.isfile(file)]
+  if len(files) == 0:
+    return None
+  if len(files) == 1:
+    os.replace(files[0], output)
+    return output
+  temp_file_xa = f'{os.path.splitext(output)[0]}.tmp_xa'
+  with open(temp_file_xa, 'w') as file:
+    file.writelines([f"file '{file}'\n" for file in files])
+  try:
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'concat',
+                    '-safe', '0', '-i', temp_file_xa, '-vcodec', 'copy',
+                    '-acodec', 'copy', output], check=True)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  finally:
+    os.remove(temp_file_xa)
+  if not os.path.isfile(output) or os.path.getsize(output) == 0:
+    return None
+  if delete_old_files:
+    for file in files:
+      if file != output:
+        os.remove(file)
+  return output
+
+
+def concate_intervals(file: str,
+                      intervals: List[Tuple[float, float]],
+                      output: str) -> Optional[str]:
+  """Extracts & concatenates portions of the video in a single pass.
+
+  Every interval is described by an inpoint & outpoint of the same
+  file in FFMPEG's concat demuxer, so all the portions are cut & joined
+  by one FFMPEG process using stream copy. The intervals should start on
+  keyframes for the cuts to be exact.
+
+  Args:
+    file: File to be used for extraction.
+    intervals: List of start & end (in secs) of the portions.
+    output: Path of the output file.
+
+  Returns:
+    Path where the concatenated file is created, None if FFMPEG failed.
+  """
+  if not intervals:
+    return None
+  temp_file_xa = f'{os.path.splitext(output)[0]}.tmp_xa'
+  # Single quotes are escaped as the concat demuxer expects them.
+  entry = os.path.abspath(file).replace("'", "'\\''")
+  with open(temp_file_xa, 'w') as list_file:
+    for start, end in intervals:
+      list_file.write(f"file '{entry}'\n"
+                      f'inpoint {start:.3f}\noutpoint {end:.3f}\n')
+  try:
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'concat',
+                    '-safe', '0', '-i', temp_file_xa, '-vcodec', 'copy',
+                    '-acodec', 'copy', '-avoid_negative_ts', 'make_zero',
+                    output], check=True)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  finally:
+    os.remove(temp_file_xa)
+  if not os.path.isfile(output) or os.path.getsize(output) == 0:
+    return None
+  return output
@@ -0,0 +1,209 @@
+"""A subservice for cutting the videos using FFMPEG."""
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple, Union
+
+from video_processing_engine.core.process.concate import concate_files
+from video_processing_engine.core.process.keyframes import gop_bounds
+
+# Portions shorter than this (in secs) are left out of the smart cuts.
+_TOLERANCE = 0.01
+
+# H264 profiles reported by FFPROBE & their names in libx264.
+_PROFILES = {'Constrained Baseline': 'baseline', 'Baseline': 'baseline',
+             'Main': 'main', 'High': 'high', 'High 10': 'high10',
+             'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'}
+
+
+def _run(command: List[str]) -> None:
+  """Run FFMPEG command, raises CalledProcessError if it fails."""
+  subprocess.run(['ffmpeg', '-loglevel', 'error', '-y'] + command,
+                 check=True)
+
+
+def _video_stream(file: str) -> Dict:
+  """Returns codec, profile, level & pixel format of the video stream."""
+  output = subprocess.check_output(['ffprobe', '-v', 'error',
+                                    '-select_streams', 'v:0', '-show_entries',
+                                    'stream=codec_name,profile,level,pix_fmt',
+                                    '-of', 'json', file])
+  return (json.loads(output.decode()).get('streams') or [{}])[0]
+
+
+def _encoder_args(stream: Dict) -> List[str]:
+  """Returns libx264 options matching the profile & level of the stream.
+
+  Parameter sets are repeated in front of every keyframe, so the edges
+  carry them in-band once they are joined with the copied GOPs.
+  """
+  args = ['-x264-params', 'repeat-headers=1']
+  if stream.get('profile') in _PROFILES:
+    args.extend(['-profile:v', _PROFILES[stream['profile']]])
+  level = stream.get('level')
+  if isinstance(level, int) and level > 0:
+    args.extend(['-level', f'{level / 10:.1f}'])
+  return args
+
+
+def stream_copy(file: str,
+                output: str,
+                start: Union[float, int],
+                end: Union[float, int],
+                bitstream_filter: Optional[str] = None) -> str:
+  """Cut portion of the video without re-encoding it.
+
+  The cut snaps to the keyframe at or before the start, so it's exact
+  only if the start is a keyframe.
+  """
+  bsf = ['-bsf:v', bitstream_filter] if bitstream_filter else []
+  _run(['-ss', f'{start:.3f}', '-i', file, '-t', f'{end - start:.3f}',
+        '-an', '-c', 'copy'] + bsf + ['-avoid_negative_ts', 'make_zero',
+                                      output])
+  return output
+
+
+def reencode(file: str,
+             output: str,
+             start: Union[float, int],
+             end: Union[float, int],
+             preset: str = 'veryfast',
+             crf: int = 18,
+             pix_fmt: str = 'yuv420p',
+             encoder_args: Optional[List[str]] = None) -> str:
+  """Cut portion of the video frame accurately by re-encoding it."""
+  _run(['-ss', f'{start:.3f}', '-i', file, '-t', f'{end - start:.3f}',
+        '-an', '-vcodec', 'libx264', '-preset', preset, '-crf', str(crf),
+        '-pix_fmt', pix_fmt] + (encoder_args or []) + [output])
+  return output
+
+
+def smart_cut(file: str,
+              output: str,
+              start: Union[float, int],
+              end: Union[float, int],
+              points: List[float]) -> str:
+  """Cut portion of the video accurately, re-encoding only it's edges.
+
+  Frames from the start till the first keyframe in the portion & from
+  the last keyframe till the end are re-encoded with the profile, level
+  & pixel format of the source, the GOPs in between are copied as is &
+  all three are joined using stream copy. The pieces are joined as
+  Annex-B MPEG-TS with the parameter sets in-band, as MP4 would keep
+  only the decoder configuration of the first piece. The portion is
+  re-encoded in full if the join fails. Non H264 videos are re-encoded
+  in full as the edges would not join with them.
+
+  Args:
+    file: File to be cut.
+    output: Path of the output file.
+    start: Starting point of the portion in secs.
+    end: Ending point of the portion in secs.
+    points: Sorted timestamps (in secs) of the keyframes in the video.
+  """
+  bounds = gop_bounds(points, start, end)
+  stream = _video_stream(file)
+  if bounds is None or stream.get('codec_name') != 'h264':
+    return reencode(file, output, start, end)
+  head, tail = bounds
+  if head - start <= _TOLERANCE and end - tail <= _TOLERANCE:
+    return stream_copy(file, output, head, tail)
+  pix_fmt = stream.get('pix_fmt') or 'yuv420p'
+  encoder_args = _encoder_args(stream)
+  temp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output)))
+  try:
+    parts = []
+    if head - start > _TOLERANCE:
+      parts.append(reencode(file, os.path.join(temp, 'head.ts'), start,
+                            head, pix_fmt=pix_fmt,
+                            encoder_args=encoder_args))
+    parts.append(stream_copy(file, os.path.join(temp, 'body.ts'), head, tail,
+                             'h264_mp4toannexb'))
+    if end - tail > _TOLERANCE:
+      parts.append(reencode(file, os.path.join(temp, 'tail.ts'), tail, end,
+                            pix_fmt=pix_fmt, encoder_args=encoder_args))
+    joined = concate_files(parts, output)
+  finally:
+    shutil.rmtree(temp, ignore_errors=True)
+  return joined or reencode(file, output, start, end)
+
+
+def segment(file: str,
+            directory: str,
+            clip_length: Union[float, int],
+            start_number: int = 1) -> List[str]:
+  """Split the whole video into fixed length clips in a single pass.
+
+  The video is demuxed once & FFMPEG's segment muxer copies the packets
+  into a new clip at the first keyframe after every `clip_length` secs,
+  so the clips are only as accurate as the keyframe interval.
+
+  Args:
+    file: File to be split.
+    directory: Directory where the clips are written.
+    clip_length: Length (in secs) of every clip.
+    start_number: Number (default: 1) of the first clip.
+
+  Returns:
+    Sorted list of paths of the clips.
+  """
+  extension = os.path.splitext(file)[1] or '.mp4'
+  pattern = os.path.join(directory, f'segment_%06d{extension}')
+  _run(['-i', file, '-map', '0:v:0', '-an', '-c', 'copy', '-f', 'segment',
+        '-segment_time', str(clip_length), '-segment_start_number',
+        str(start_number), '-reset_timestamps', '1', pattern])
+  return sorted(os.path.join(directory, idx) for idx in os.listdir(directory)
+                if idx.startswith('segment_'))
+
+
+def cut_points(total: Union[float, int],
+               clip_length: Union[float, int],
+               last_clip: bool = True) -> List[Tuple[float, float]]:
+  """Returns start & end (in secs) of the fixed length clips.
+
+  Args:
+    total: Duration (in secs) of the video.
+    clip_length: Length (in secs) of every clip.
+    last_clip: Boolean (default: True) value to consider the remaining
+               portion of the video.
+  """
+  points, start = [], 0.0
+  while start + clip_length < total:
+    points.append((start, start + clip_length))
+    start += clip_length
+  if last_clip and start < total:
+    points.append((start, float(total)))
+  return points
+
+
+def multi_copy(file: str,
+               cuts: List[Tuple[str, Union[float, int], Union[float, int]]]
+               ) -> List[str]:
+  """Cut several portions of the video using a single FFMPEG process.
+
+  The file is opened & probed once & demuxed in a single pass, every
+  portion is an output of it's own which is seeked on the output side &
+  written using stream copy. As output seeking drops every packet before
+  the start, the starts must be keyframes (`TrimPlan` snaps them).
+
+  Args:
+    file: File to be cut.
+    cuts: List of output path, start & end (in secs) of the portions.
+
+  Returns:
+    List of paths of the outputs.
+  """
+  outputs = []
+  for output, start, end in cuts:
+    # Rounded down so that the keyframe at the start is always kept.
+    start = math.floor(start * 1000) / 1000
+    outputs.extend(['-map', '0:v:0', '-an', '-c', 'copy', '-ss',
+                    f'{start:.3f}', '-t', f'{end - start:.3f}',
+                    '-avoid_negative_ts', 'make_zero', output])
+  if cuts:
+    _run(['-i', file] + outputs)
+  return [output for output, _, _ in cuts]
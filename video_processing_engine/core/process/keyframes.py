@@ -0,0 +1,110 @@
+"""A subservice for indexing the keyframes of the videos."""
+
+import hashlib
+import os
+import subprocess
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from video_processing_engine.utils.local import evict_lru
+from video_processing_engine.utils.paths import keyframe_cache
+from video_processing_engine.vars import dev
+
+
+def index_path(file: str) -> str:
+  """Returns path of the cached keyframe index of the video."""
+  digest = hashlib.blake2b(os.path.abspath(file).encode(dev.DEF_CHARSET),
+                           digest_size=16).hexdigest()
+  return os.path.join(keyframe_cache, f'{digest}.npz')
+
+
+def build_index(file: str) -> Tuple[np.ndarray, np.ndarray]:
+  """Returns timestamps (in secs) & byte offsets of the keyframes.
+
+  The keyframes are read from the packet flags using FFPROBE, so the
+  video is only demuxed & not decoded.
+  """
+  output = subprocess.check_output(['ffprobe', '-v', 'error',
+                                    '-select_streams', 'v:0', '-show_entries',
+                                    'packet=pts_time,pos,flags', '-of',
+                                    'csv=p=0', file])
+  pts, pos = [], []
+  for line in output.decode().splitlines():
+    pts_time, _, rest = line.partition(',')
+    offset, _, flags = rest.partition(',')
+    if 'K' in flags and pts_time not in ('', 'N/A'):
+      pts.append(float(pts_time))
+      pos.append(int(offset) if offset.isdigit() else -1)
+  order = np.argsort(pts, kind='stable')
+  return (np.asarray(pts, np.float64)[order],
+          np.asarray(pos, np.int64)[order])
+
+
+def keyframe_index(file: str) -> Tuple[np.ndarray, np.ndarray]:
+  """Returns keyframe index of the video, built only once per file.
+
+  The index is saved as an `.npz` file in the keyframe cache (keyed by
+  the path of the video) along with the size & modification time of the
+  video, & is rebuilt as soon as either of them changes. Indexes of the
+  deleted videos are never read again & are evicted as least recently
+  used once the cache grows beyond it's limit.
+
+  Returns:
+    Sorted timestamps (in secs) & byte offsets (-1 if unknown) of the
+    keyframes.
+  """
+  stat = os.stat(file)
+  path = index_path(file)
+  try:
+    with np.load(path) as index:
+      fresh = (int(index['size']) == stat.st_size and
+               int(index['mtime']) == stat.st_mtime_ns)
+      if fresh:
+        pts, pos = index['pts'], index['pos']
+    if fresh:
+      # Touching the file marks the index as recently used.
+      os.utime(path)
+      return pts, pos
+  except (OSError, KeyError, ValueError):
+    pass
+  pts, pos = build_index(file)
+  try:
+    os.makedirs(keyframe_cache, exist_ok=True)
+    temp = f'{path}.tmp.npz'
+    np.savez(temp, pts=pts, pos=pos, size=np.int64(stat.st_size),
+             mtime=np.int64(stat.st_mtime_ns))
+    os.replace(temp, path)
+    evict_lru(keyframe_cache, dev.KEYFRAME_CACHE_SIZE)
+  except OSError:
+    # Read-only caches just go without the index.
+    pass
+  return pts, pos
+
+
+def keyframes(file: str) -> List[float]:
+  """Returns timestamps (in secs) of the keyframes in the video file."""
+  return keyframe_index(file)[0].tolist()
+
+
+def previous_keyframe(points: Union[List[float], np.ndarray],
+                      position: float) -> float:
+  """Returns keyframe at or before the position (in secs)."""
+  idx = int(np.searchsorted(points, position, side='right')) - 1
+  return float(points[idx]) if idx >= 0 else 0.0
+
+
+def gop_bounds(points: Union[List[float], np.ndarray],
+               start: float,
+               end: float) -> Optional[Tuple[float, float]]:
+  """Returns the first & last keyframe within the range (in secs).
+
+  Portion between them is made of whole GOPs & can be stream copied,
+  only the portions outside of them need to be re-encoded. Returns None
+  if the range doesn't contain 2 keyframes.
+  """
+  first = int(np.searchsorted(points, start, side='left'))
+  last = int(np.searchsorted(points, end, side='right')) - 1
+  if last <= first:
+    return None
+  return float(points[first]), float(points[last])
@@ -0,0 +1,140 @@
+"""A subservice for planning the clips to be trimmed from the videos."""
+
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from video_processing_engine.core.process.cutter import (multi_copy,
+                                                        smart_cut,
+                                                        stream_copy)
+from video_processing_engine.core.process.keyframes import (keyframe_index,
+                                                           previous_keyframe)
+from video_processing_engine.utils.logs import log as _log
+
+# Clip: output path, start & end (in secs).
+Cut = Tuple[str, float, float]
+
+
+class TrimPlan(object):
+  """Collects all the clips to be trimmed from a video & cuts them at once.
+
+  Clips are only recorded by `add()`. `execute()` compiles them into
+  unique ranges (clips asking for the same portion are cut once & copied)
+  & cuts them in batches, each batch using a single FFMPEG process with
+  stream copy. As stream copy starts on the keyframes, starts are moved
+  back to their keyframe using the cached keyframe index before the
+  ranges are compared. Batches run on a bounded pool. In accurate mode,
+  every range is smart cut on it's own instead. A plan with a single
+  clip (like a sample of a temporary copy) is stream copied straight
+  away, without building a keyframe index it would never reuse.
+
+  Args:
+    file: File to be trimmed.
+    accurate: Boolean (default: False) value to cut the clips exactly by
+              re-encoding their boundary GOPs.
+    batch_size: Maximum number (default: 16) of clips cut per process.
+    workers: Number of processes (default: 2) running at once.
+  """
+
+  def __init__(self,
+               file: str,
+               accurate: bool = False,
+               batch_size: int = 16,
+               workers: int = 2) -> None:
+    super(TrimPlan, self).__init__()
+    self.file = file
+    self.accurate = accurate
+    self.batch_size = max(int(batch_size), 1)
+    self.workers = max(int(workers), 1)
+    self.cuts: List[Cut] = []
+
+  def add(self,
+          output: str,
+          start: Union[float, int],
+          end: Union[float, int]) -> str:
+    """Add clip (start & end in secs) of the video to the plan."""
+    start, end = max(float(start), 0.0), float(end)
+    if end <= start:
+      raise ValueError(f'Clip "{os.path.basename(output)}" ends at {end} '
+                       f'secs before it starts at {start} secs.')
+    self.cuts.append((output, start, end))
+    return output
+
+  def compile(self,
+              points: Optional[np.ndarray] = None
+              ) -> List[Tuple[float, float, List[str]]]:
+    """Returns unique ranges (sorted by start) & their outputs.
+
+    Args:
+      points: Sorted timestamps (default: None) of the keyframes to snap
+              the starts to.
+    """
+    ranges = {}
+    for output, start, end in self.cuts:
+      if points is not None and len(points):
+        start = previous_keyframe(points, start)
+      ranges.setdefault((round(start, 3), round(end, 3)), []).append(output)
+    return [(start, end, outputs)
+            for (start, end), outputs in sorted(ranges.items())]
+
+  def _cut(self,
+           job: List[Tuple[float, float, List[str]]],
+           points: Optional[np.ndarray]
+           ) -> List[Tuple[List[str], float, float, float]]:
+    """Cut the job's ranges & returns them with the time spent on each."""
+    started = time.time()
+    if self.accurate:
+      for start, end, outputs in job:
+        smart_cut(self.file, outputs[0], start, end, points)
+    elif points is None:
+      for start, end, outputs in job:
+        stream_copy(self.file, outputs[0], start, end)
+    else:
+      multi_copy(self.file, [(outputs[0], start, end)
+                             for start, end, outputs in job])
+    elapsed = time.time() - started
+    # Time spent by a shared process is split as per the clip's length.
+    total = sum(end - start for start, end, _ in job)
+    return [(outputs, start, end, elapsed * (end - start) / total)
+            for start, end, outputs in job]
+
+  def execute(self, log: logging.Logger = None) -> List[Tuple[str, float]]:
+    """Cut all the planned clips.
+
+    Args:
+      log: Logger object.
+
+    Returns:
+      List of output path & the time (in secs) spent on every clip, in
+      the order they were added.
+    """
+    log = _log(__file__) if log is None else log
+    if not self.cuts:
+      return []
+    started = time.time()
+    points = None
+    if self.accurate or len(self.cuts) > 1:
+      points = keyframe_index(self.file)[0]
+    ranges = self.compile(None if self.accurate else points)
+    size = 1 if self.accurate else self.batch_size
+    jobs = [ranges[idx:idx + size] for idx in range(0, len(ranges), size)]
+    spent = {}
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      for results in pool.map(lambda job: self._cut(job, points), jobs):
+        for outputs, start, end, seconds in results:
+          for output in outputs[1:]:
+            shutil.copyfile(outputs[0], output)
+          for output in outputs:
+            spent[output] = seconds
+          log.info(f'Trimmed "{os.path.basename(outputs[0])}" '
+                   f'({start:.2f} - {end:.2f} secs) in {seconds:.2f} secs.')
+    log.info(f'Trimmed {len(self.cuts)} clip(s) from {len(ranges)} unique '
+             f'range(s) in {time.time() - started:.2f} secs.')
+    report = [(output, spent[output]) for output, _, _ in self.cuts]
+    self.cuts = []
+    return report
@@ -0,0 +1,71 @@
+"""A subservice for probing the media information of the videos."""
+
+import json
+import os
+import subprocess
+from collections import namedtuple
+from fractions import Fraction
+from functools import lru_cache
+from typing import Optional
+
+from video_processing_engine.core.process.keyframes import keyframe_index
+
+# Media information of a video: duration (in secs), frame rate, width &
+# height (in pixels), bitrate (in bits per sec), name of the video codec,
+# number of frames & keyframes (None unless counted).
+MediaInfo = namedtuple('MediaInfo', ['duration', 'fps', 'width', 'height',
+                                     'bitrate', 'codec', 'frames',
+                                     'keyframes'])
+
+
+def _rate(value: Optional[str]) -> float:
+  """Returns frame rate given as a fraction like `30000/1001`."""
+  try:
+    return float(Fraction(value))
+  except (TypeError, ValueError, ZeroDivisionError):
+    return 0.0
+
+
+@lru_cache(maxsize=256)
+def _probe(path: str,
+           size: int,
+           mtime: int,
+           count_keyframes: bool) -> MediaInfo:
+  """Returns media information of the file's version (size & mtime)."""
+  output = subprocess.check_output(['ffprobe', '-v', 'error',
+                                    '-print_format', 'json', '-show_format',
+                                    '-show_streams', '-select_streams', 'v:0',
+                                    path])
+  info = json.loads(output.decode())
+  stream = (info.get('streams') or [{}])[0]
+  container = info.get('format', {})
+  duration = float(container.get('duration') or
+                   stream.get('duration') or 0.0)
+  fps = (_rate(stream.get('avg_frame_rate')) or
+         _rate(stream.get('r_frame_rate')))
+  frames = stream.get('nb_frames')
+  # Few containers (like MKV) don't store the frame count.
+  frames = int(frames) if frames else int(round(duration * fps))
+  bitrate = container.get('bit_rate') or stream.get('bit_rate') or 0
+  keyframes = len(keyframe_index(path)[0]) if count_keyframes else None
+  return MediaInfo(duration, fps, int(stream.get('width', 0)),
+                   int(stream.get('height', 0)), int(bitrate),
+                   stream.get('codec_name'), frames, keyframes)
+
+
+def probe(file: str, count_keyframes: bool = False) -> MediaInfo:
+  """Returns media information of the video using a single FFPROBE call.
+
+  Results are memoized per path, size & modification time of the file,
+  so repeated calls for an unchanged video never spawn FFPROBE again &
+  a modified video is probed afresh. Least recently used results are
+  evicted once 256 of them are cached.
+
+  Args:
+    file: File to be probed.
+    count_keyframes: Boolean (default: False) value to count keyframes,
+                     this demuxes the whole video the first time.
+  """
+  stat = os.stat(file)
+  return _probe(os.path.abspath(file), stat.st_size, stat.st_mtime_ns,
+                count_keyframes)
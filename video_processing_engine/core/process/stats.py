@@ -4,10 +4,9 @@ import os
 from statistics import median
 from typing import Tuple, Union
 
-import cv2
 import speedtest
-from moviepy.editor import VideoFileClip as vfc
 
+from video_processing_engine.core.process.probe import probe
 from video_processing_engine.utils.common import check_internet, file_size, seconds_to_datetime
 from video_processing_engine.utils.hasher import h_extension
 
@@ -31,24 +30,25 @@ def duration(file: str,
              for_humans: bool = False) -> Union[float, str, int]:
   """Returns duration of the video file."""
   if for_humans:
-    mins, secs = divmod(vfc(file, audio=False).duration, 60)
+    mins, secs = divmod(probe(file).duration, 60)
     hours, mins = divmod(mins, 60)
     return '%02d:%02d:%02d' % (hours, mins, secs)
   else:
-    return vfc(file, audio=False).duration
+    return probe(file).duration
 
 
 def bitrate(file: str) -> int:
   """Returns bitrate of the video file."""
   # You can find the reference code here:
   # https://www.ezs3.com/public/What_bitrate_should_I_use_when_encoding_my_video_How_do_I_optimize_my_video_for_the_web.cfm
-  return (vfc(file, audio=False).size[0] * vfc(file, audio=False).size[1] *
-          (vfc(file, audio=False).reader.nframes // vfc(file, audio=False).duration) * 0.07 // 1000)
+  info = probe(file)
+  return (info.width * info.height *
+          (info.frames // info.duration) * 0.07 // 1000)
 
 
 def fps(file: str) -> Union[float, int]:
   """Returns fps of the video file."""
-  return cv2.VideoCapture(file).get(cv2.CAP_PROP_FPS)
+  return probe(file).fps
 
 
 def check_usable_length(file: str, num_clips: int = 24,
@@ -59,10 +59,7 @@ def check_usable_length(file: str, num_clips: int = 24,
 
 def new_bitrate(file: str) -> int:
   """Returns bitrate of the video file."""
-  import subprocess
-
-  bit = subprocess.check_output(f"ffprobe -hide_banner -loglevel 0 -of flat -i '{file}' -select_streams v -show_entries 'format=bit_rate'", shell=True)
-  return int(bit.decode().replace('"', '').strip('format.bit_rate='))
+  return probe(file).bitrate
 
 
 def all_stats(file: str) -> Tuple:
@@ -1,16 +1,21 @@
 """A subservice for trimming the videos."""
 
+import os
 import random
-import time
+import shutil
+import tempfile
 from datetime import datetime
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 from moviepy.editor import VideoFileClip as vfc
 
+from video_processing_engine.core.process.cutter import (cut_points, segment,
+                                                        smart_cut)
+from video_processing_engine.core.process.keyframes import keyframes
+from video_processing_engine.core.process.planner import TrimPlan
 from video_processing_engine.core.process.stats import duration
 from video_processing_engine.utils.common import calculate_duration, now
-from video_processing_engine.utils.local import (filename, quick_rename,
-                                                 temporary_copy)
+from video_processing_engine.utils.local import filename, temporary_copy
 
 
 def trim_video(file: str,
@@ -42,9 +47,12 @@ def trim_num_parts(file: str,
                    equal_distribution: bool = False,
                    clip_length: Union[float, int, str] = 30,
                    random_start: bool = True,
-                   random_sequence: bool = True) -> Optional[List]:
+                   random_sequence: bool = True,
+                   plan: Optional[TrimPlan] = None) -> Optional[List]:
   """Trim video in number of equal parts.
-  Trims the video as per the number of clips required.
+  Trims the video as per the number of clips required. With equal
+  distribution, the sampled portion of every part is cut straight out of
+  the video instead of trimming the part twice.
   Args:
     file: File to be used for trimming.
     num_parts: Number of videos to be trimmed into.
@@ -59,28 +67,28 @@ def trim_num_parts(file: str,
     verbose: Boolean (default: False) value to display the status.
     return_list: Boolean (default: True) value to return list of all the
                  trimmed files.
+    plan: Trim plan (default: None) to add the clips to. If None, the
+          clips are trimmed right away.
   """
   num_parts = int(num_parts)
   clip_length = int(clip_length)
   split_part = duration(file) / num_parts
+  execute, plan = plan is None, plan or TrimPlan(file)
   start = 0
   # Start splitting the videos into 'num_parts' equal parts.
   video_list = []
   for idx in range(1, num_parts + 1):
-    start, end = start, start + split_part
-    trim_video(file, filename(file, idx), start, end)
+    part_start, part_end = start, start + split_part
+    if equal_distribution and clip_length <= split_part:
+      offset = 0
+      if random_start:
+        offset = random.randint(1, max(int(split_part - clip_length), 1))
+      part_start = start + offset
+      part_end = min(part_start + clip_length, start + split_part)
+    video_list.append(plan.add(filename(file, idx), part_start, part_end))
     start += split_part
-    video_list.append(filename(file, idx))
-  if equal_distribution:
-    for file in video_list:
-      if clip_length <= split_part:
-        start, end = 0, clip_length
-        if random_start:
-          start = random.randint(1, int(duration(file)))
-          end = start + clip_length
-        file, temp = quick_rename(file)
-        trim_video(temp, file, start, end)
-        time.sleep(2.0)
+  if execute:
+    plan.execute()
   if random_sequence:
     return random.shuffle(video_list)
   else:
@@ -88,12 +96,20 @@ def trim_num_parts(file: str,
 
 
 def trim_sample_section(file: str,
-                        sampling_rate: Union[float, int, str]) -> str:
+                        sampling_rate: Union[float, int, str],
+                        window: Optional[Tuple[float, float]] = None,
+                        source: Optional[str] = None) -> str:
   """Trim a sample portion of the video as per the sampling rate.
   Trims a random sample portion of the video as per the sampling rate.
+  The sample is written over the file.
   Args:
     file: File to be used for trimming.
     sampling_rate: Portion of the video to be trimmed.
+    window: Start & end (default: None -> random) in secs of the portion
+            to be sampled, like the busiest window of the activity.
+    source: File (default: None -> file) the sample is cut from, like
+            the original video the activity timeline maps to. It's only
+            read, never written.
     codec: Codec (default: libx264 -> .mp4) to be used while trimming.
     bitrate: Bitrate (default: min. 400) used while trimming.
     fps: FPS (default: 24) of the trimmed video.
@@ -108,26 +124,37 @@ def trim_sample_section(file: str,
   sampling_rate = float(sampling_rate)
   temp = temporary_copy(file)
 
-  clip_length = int((duration(file) * sampling_rate * 0.01))
-  start = random.randint(1, int(duration(file) - clip_length))
-  end = start + clip_length
-  trim_video(temp, file, start, end)
+  source = temp if source is None else source
+
+  if window:
+    start, end = window
+  else:
+    clip_length = int((duration(source) * sampling_rate * 0.01))
+    start = random.randint(1, int(duration(source) - clip_length))
+    end = start + clip_length
+  plan = TrimPlan(source)
+  plan.add(file, start, end)
+  plan.execute()
   return temp
 
 
 def trim_by_factor(file: str,
                    factor: str = 's',
                    clip_length: Union[float, int, str] = 30,
-                   last_clip: bool = True) -> List:
+                   last_clip: bool = True,
+                   accurate: bool = False) -> List:
   """Trims the video by deciding factor.
   Trims the video as per the deciding factor i.e. trim by mins OR trim
-  by secs.
+  by secs. All the clips are cut by a single FFMPEG process using the
+  segment muxer & stream copy, so the clips start on the keyframes.
   Args:
     file: File to be used for trimming.
     factor: Trimming factor (default: secs -> s) to consider.
     clip_length: Length (default: 30) of each video clip.
     last_clip: Boolean (default: True) value to consider the remaining
                portion of the trimmed video.
+    accurate: Boolean (default: False) value to cut the clips exactly at
+              the clip length by re-encoding their boundary GOPs.
     codec: Codec (default: libx264 -> .mp4) to be used while trimming.
     bitrate: Bitrate (default: min. 400) used while trimming.
     fps: FPS (default: 24) of the trimmed video clips.
@@ -138,23 +165,27 @@ def trim_by_factor(file: str,
     threads: Number of threads (default: 15) to be used for trimming.
   """
   clip_length = int(clip_length)
-  total_length = duration(file)
-  video_list = []
-  idx = 1
   if factor == 'm':
-    start, end, clip_length = 0, clip_length * 60, clip_length * 60
-  else:
-    start, end = 0, clip_length
-  while clip_length < total_length:
-    trim_video(file, filename(file, idx), start, end)
-    video_list.append(filename(file, idx))
-    start, end, idx = end, end + clip_length, idx + 1
-    total_length -= clip_length
-  else:
-    if last_clip:
-      start, end = (duration(file) - total_length), duration(file)
-      trim_video(file, filename(file, idx), start, end)
+    clip_length *= 60
+  video_list = []
+  if accurate:
+    points = keyframes(file)
+    for idx, (start, end) in enumerate(
+            cut_points(duration(file), clip_length, last_clip), 1):
+      smart_cut(file, filename(file, idx), start, end, points)
       video_list.append(filename(file, idx))
+    return video_list
+  temp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(file)))
+  try:
+    clips = segment(file, temp, clip_length)
+    # Last segment is the remaining portion of the video.
+    if not last_clip:
+      clips = clips[:-1]
+    for idx, clip in enumerate(clips, 1):
+      os.replace(clip, filename(file, idx))
+      video_list.append(filename(file, idx))
+  finally:
+    shutil.rmtree(temp, ignore_errors=True)
   return video_list
 
 
@@ -163,7 +194,8 @@ def trim_sub_sample(file: str,
                     end_time: str,
                     sample_start_time: str,
                     sample_end_time: str,
-                    timestamp_format: str = '%H:%M:%S') -> str:
+                    timestamp_format: str = '%H:%M:%S',
+                    plan: Optional[TrimPlan] = None) -> str:
   """Trims sample of the video based on provided timestamp."""
   trim_duration = calculate_duration(sample_start_time, sample_end_time)
   _start_time = datetime.strptime(start_time, timestamp_format)
@@ -185,14 +217,19 @@ def trim_sub_sample(file: str,
     end = int(start + trim_duration)
   else:
     end = duration(file)
-  trim_video(file, filename(file, idx), start, end)
+  if plan is not None:
+    return plan.add(filename(file, idx), start, end)
+  plan = TrimPlan(file)
+  plan.add(filename(file, idx), start, end)
+  plan.execute()
   return filename(file, idx)
 
 
 def trim_by_points(file: str,
                    start_time: int,
                    end_time: int,
-                   factor: str = 's') -> str:
+                   factor: str = 's',
+                   plan: Optional[TrimPlan] = None) -> str:
   """Trim by starting minute OR starting seconds."""
   idx = 1
   start_time = int(start_time)
@@ -218,6 +255,10 @@ def trim_by_points(file: str,
     elif start_time < 0:
       print('Start should be greater than 0.')
       start_time = 0
-    trim_video(file, filename(file, idx), start_time * _factor,
-               end_time * _factor)
+    if plan is not None:
+      return plan.add(filename(file, idx), start_time * _factor,
+                      end_time * _factor)
+    plan = TrimPlan(file)
+    plan.add(filename(file, idx), start_time * _factor, end_time * _factor)
+    plan.execute()
   return filename(file, idx)
@@ -0,0 +1,113 @@
+"""A subservice for caching face detections across the renders."""
+
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from video_processing_engine.core.redact.detectors import (Box, Detection,
+                                                           score)
+from video_processing_engine.utils.local import evict_lru
+from video_processing_engine.utils.paths import face_cache
+from video_processing_engine.vars import dev
+
+
+def content_hash(file: str, chunk_size: int = 1024 ** 2) -> str:
+  """Returns BLAKE2b digest of the file's content."""
+  digest = hashlib.blake2b(digest_size=16)
+  buffer = bytearray(chunk_size)
+  view = memoryview(buffer)
+  with open(file, 'rb') as source:
+    while True:
+      count = source.readinto(buffer)
+      if not count:
+        break
+      digest.update(view[:count])
+  return digest.hexdigest()
+
+
+class FaceCache(object):
+  """On-disk cache of the face detections of the videos.
+
+  Detections are stored as a compact `.npz` file per video & detector
+  configuration: frame index, bounding box & confidence score of every
+  face along with the total number of frames. Files are keyed by the
+  content hash of the video, so renamed copies of the same order hit the
+  cache too. Whenever the cache grows beyond `max_size`, least recently
+  used entries are removed.
+
+  Args:
+    directory: Directory (default: downloads/face_cache) of the cache.
+    max_size: Maximum size (default: 2 GB) of the cache in bytes.
+  """
+
+  def __init__(self,
+               directory: str = face_cache,
+               max_size: int = dev.FACE_CACHE_SIZE) -> None:
+    super(FaceCache, self).__init__()
+    self.directory = directory
+    self.max_size = max_size
+    os.makedirs(self.directory, exist_ok=True)
+
+  def key(self, file: str, **params) -> str:
+    """Returns cache key of the video & the detector configuration."""
+    config = json.dumps(params, sort_keys=True, default=str)
+    params_hash = hashlib.blake2b(config.encode(dev.DEF_CHARSET),
+                                  digest_size=8).hexdigest()
+    return f'{content_hash(file)}_{params_hash}'
+
+  def path(self, key: str) -> str:
+    """Returns path of the cached detections."""
+    return os.path.join(self.directory, f'{key}.npz')
+
+  def load(self, key: str) -> Optional[List[List[Detection]]]:
+    """Returns cached detections of every frame, None if missing."""
+    path = self.path(key)
+    if not os.path.isfile(path):
+      return None
+    try:
+      with np.load(path) as cached:
+        frames, boxes = cached['frames'], cached['boxes']
+        total = int(cached['total'])
+        # Entries cached before the scores were stored have none.
+        scores = (cached['scores'] if 'scores' in cached.files else
+                  np.full(len(boxes), np.nan, np.float32))
+    except (OSError, KeyError, ValueError):
+      # Partially written or corrupt entries are treated as a miss.
+      return None
+    # Touching the file marks the entry as recently used.
+    os.utime(path)
+    if total == 0:
+      return []
+    counts = np.bincount(frames, minlength=total)
+    splits = np.cumsum(counts)[:-1]
+    return [[Detection(tuple(int(idx) for idx in box), box_score)
+             for box, box_score in zip(chunk, chunk_scores)]
+            for chunk, chunk_scores in zip(np.split(boxes, splits),
+                                           np.split(scores, splits))]
+
+  def save(self, key: str, detections: List[List[Box]]) -> str:
+    """Save detections of every frame & return path of the entry."""
+    counts = [len(idx) for idx in detections]
+    frames = np.repeat(np.arange(len(detections), dtype=np.uint32), counts)
+    boxes = np.array([box for idx in detections for box in idx],
+                     np.int32).reshape(-1, 4)
+    scores = np.array([score(box) for idx in detections for box in idx],
+                      np.float32)
+    path = self.path(key)
+    temp = f'{path}.tmp.npz'
+    np.savez_compressed(temp, frames=frames, boxes=boxes, scores=scores,
+                        total=np.uint32(len(detections)))
+    os.replace(temp, path)
+    self.evict()
+    return path
+
+  def evict(self) -> int:
+    """Remove least recently used entries above the size limit.
+
+    Returns:
+      Number of bytes freed.
+    """
+    return evict_lru(self.directory, self.max_size)
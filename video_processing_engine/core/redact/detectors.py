@@ -0,0 +1,208 @@
+"""A subservice for loading & sharing the face detection models."""
+
+import os
+import threading
+from typing import Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from video_processing_engine.utils.paths import (caffemodel, frontal_haar,
+                                                 prototxt)
+from video_processing_engine.vars import models as md
+
+# Bounding box (x0, y0, x1, y1) of a detected face.
+Box = Tuple[int, int, int, int]
+
+
+class Detection(tuple):
+  """Bounding box (x0, y0, x1, y1) along with it's confidence score.
+
+  Behaves like a plain box everywhere else, only the face cache reads the
+  `score`. Detectors which don't score their faces (Haar) leave it NaN.
+  """
+
+  def __new__(cls, box: Box, score: float = float('nan')) -> 'Detection':
+    detection = super(Detection, cls).__new__(cls, box)
+    detection.score = float(score)
+    return detection
+
+
+def score(box: Box) -> float:
+  """Returns confidence score of the box, NaN if it's unknown."""
+  return getattr(box, 'score', float('nan'))
+
+
+class MTCNNDetector(object):
+  """Detects faces using MTCNN, loads TensorFlow on first use only.
+
+  Args:
+    min_face_size: Minimum size (default: 20 pixels) of the faces.
+  """
+  name = 'mtcnn'
+
+  def __init__(self, min_face_size: int = 20) -> None:
+    super(MTCNNDetector, self).__init__()
+    from mtcnn import MTCNN
+    self.model = MTCNN(min_face_size=min_face_size)
+    self.batched = True
+
+  @staticmethod
+  def boxes(faces: List[dict], confidence: float) -> List[Box]:
+    """Returns bounding boxes of the confident detections of a frame."""
+    boxes = []
+    for face_idx in faces:
+      # Considering detections which have confidence score higher than the
+      # set threshold.
+      if face_idx['confidence'] > confidence:
+        x0, y0, x1, y1 = face_idx['box']
+        x0, y0 = abs(x0), abs(y0)
+        boxes.append(Detection((x0, y0, x0 + x1, y0 + y1),
+                               face_idx['confidence']))
+    return boxes
+
+  def detect(self, frame: np.ndarray, confidence: float = 0.75) -> List[Box]:
+    """Returns bounding boxes of the faces in the BGR frame."""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return self.boxes(self.model.detect_faces(rgb), confidence)
+
+  def detect_batch(self,
+                   frames: List[np.ndarray],
+                   confidence: float = 0.75) -> List[List[Box]]:
+    """Returns bounding boxes of the faces in every BGR frame.
+
+    Releases of MTCNN which accept a list of images run their stages
+    once for the whole batch, older ones are called frame by frame.
+    """
+    if self.batched and len(frames) > 1:
+      try:
+        rgbs = [cv2.cvtColor(idx, cv2.COLOR_BGR2RGB) for idx in frames]
+        results = self.model.detect_faces(rgbs)
+        if len(results) == len(frames) and all(isinstance(idx, list)
+                                               for idx in results):
+          return [self.boxes(idx, confidence) for idx in results]
+      except Exception:
+        pass
+      self.batched = False
+    return [self.detect(idx, confidence) for idx in frames]
+
+
+class DNNDetector(object):
+  """Detects faces using OpenCV's DNN module & res10 300x300 SSD model.
+
+  Args:
+    input_size: Size (default: 300 pixels) of the network's input.
+  """
+  name = 'dnn'
+
+  def __init__(self, input_size: int = 300) -> None:
+    super(DNNDetector, self).__init__()
+    self.input_size = input_size
+    self.model = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+
+  def blob(self, frame: np.ndarray) -> np.ndarray:
+    """Returns the frame prepared as the network's input."""
+    size = (self.input_size, self.input_size)
+    return cv2.dnn.blobFromImage(cv2.resize(frame, size), 1.0, size,
+                                 (104.0, 177.0, 123.0))
+
+  def boxes(self,
+            detections: np.ndarray,
+            shape: Tuple[int, ...],
+            confidence: float) -> List[Box]:
+    """Returns bounding boxes of the confident detections of a frame."""
+    height, width = shape[:2]
+    detections = detections[detections[:, 2] > confidence]
+    scaled = detections[:, 3:7] * np.array([width, height, width, height])
+    scaled = np.clip(scaled, 0, [width, height, width, height])
+    return [Detection(tuple(int(idx) for idx in box), score)
+            for box, score in zip(scaled, detections[:, 2])
+            if box[2] > box[0] and box[3] > box[1]]
+
+  def detect(self,
+             frame: np.ndarray,
+             confidence: float = md.DETECTED_FACE_CONFIDENCE) -> List[Box]:
+    """Returns bounding boxes of the faces in the BGR frame."""
+    self.model.setInput(self.blob(frame))
+    return self.boxes(self.model.forward()[0, 0], frame.shape, confidence)
+
+  def detect_batch(self,
+                   frames: List[np.ndarray],
+                   confidence: float = md.DETECTED_FACE_CONFIDENCE
+                   ) -> List[List[Box]]:
+    """Returns bounding boxes of the faces in every BGR frame.
+
+    All the frames are passed through the network in a single forward
+    pass & the detections are scattered back using their image ids.
+    """
+    if not frames:
+      return []
+    size = (self.input_size, self.input_size)
+    self.model.setInput(cv2.dnn.blobFromImages(
+        [cv2.resize(idx, size) for idx in frames], 1.0, size,
+        (104.0, 177.0, 123.0)))
+    detections = self.model.forward()[0, 0]
+    image_ids = detections[:, 0].astype(np.int64)
+    return [self.boxes(detections[image_ids == idx], frame.shape, confidence)
+            for idx, frame in enumerate(frames)]
+
+
+class HaarDetector(object):
+  """Detects faces using Haar cascade, built once instead of every frame.
+
+  Args:
+    scale_factor: Scale (default: 1.3) between the image pyramids.
+    min_neighbors: Minimum neighbours (default: 5) to keep a detection.
+  """
+  name = 'haar'
+
+  def __init__(self,
+               scale_factor: float = 1.3,
+               min_neighbors: int = 5) -> None:
+    super(HaarDetector, self).__init__()
+    self.scale_factor = scale_factor
+    self.min_neighbors = min_neighbors
+    self.model = cv2.CascadeClassifier(frontal_haar)
+
+  def detect(self, frame: np.ndarray, confidence: float = 0.0) -> List[Box]:
+    """Returns bounding boxes of the faces in the BGR frame."""
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return [Detection((x0, y0, x0 + x1, y0 + y1))
+            for (x0, y0, x1, y1) in self.model.detectMultiScale(
+                gray_frame, self.scale_factor, self.min_neighbors)]
+
+  def detect_batch(self,
+                   frames: List[np.ndarray],
+                   confidence: float = 0.0) -> List[List[Box]]:
+    """Returns bounding boxes of the faces in every BGR frame."""
+    return [self.detect(idx, confidence) for idx in frames]
+
+
+DETECTORS = {idx.name: idx for idx in (MTCNNDetector, DNNDetector,
+                                       HaarDetector)}
+
+_loaded: Dict[Tuple, object] = {}
+_lock = threading.Lock()
+
+
+def get_detector(backend: str = 'mtcnn', **kwargs) -> Union[MTCNNDetector,
+                                                            DNNDetector,
+                                                            HaarDetector]:
+  """Returns face detector of the backend, loading it on first use.
+
+  Detectors are cached per process, so worker processes (including the
+  forked ones) load their own copy once & reuse it for every frame.
+
+  Args:
+    backend: Detector (default: mtcnn) to be used, either `mtcnn`, `dnn`
+             or `haar`.
+    kwargs: Options supported by the selected detector.
+  """
+  if backend not in DETECTORS:
+    raise ValueError(f'Unsupported face detector "{backend}".')
+  key = (os.getpid(), backend, tuple(sorted(kwargs.items())))
+  if key not in _loaded:
+    with _lock:
+      if key not in _loaded:
+        _loaded[key] = DETECTORS[backend](**kwargs)
+  return _loaded[key]
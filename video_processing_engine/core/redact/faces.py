@@ -4,56 +4,155 @@ import csv
 import logging
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
-from mtcnn import MTCNN
 
+from video_processing_engine.core.detect.sources import open_source
+from video_processing_engine.core.process.encoder import FFmpegWriter
+from video_processing_engine.core.redact.cache import FaceCache
+from video_processing_engine.core.redact.detectors import get_detector
+from video_processing_engine.core.redact.tracking import (DifferenceGate,
+                                                          FaceTracker)
 from video_processing_engine.utils.common import seconds_to_datetime as s2d
-from video_processing_engine.utils.local import filename
 from video_processing_engine.utils.logs import log as _log
-from video_processing_engine.utils.opencvapi import draw_bounding_box, rescale
-from video_processing_engine.utils.paths import frontal_haar
+from video_processing_engine.utils.opencvapi import draw_bounding_box
 from video_processing_engine.vars import color, dev
 
-face_detector = MTCNN(min_face_size=20)
-
-
-def pixelate(face_roi):
-  """Pixelate faces like in ..."""
-  # You can find the reference code here:
-  # https://www.pyimagesearch.com/2020/04/06/blur-and-anonymize-faces-with-opencv-and-python/
-  height, width, _ = face_roi.shape
-  blocks = width * 0.01
-  x_steps = np.linspace(0, width, 8, dtype='int')
-  y_steps = np.linspace(0, height, 8, dtype='int')
-  # Looping over blocks in both X & Y direction.
-  for y_idx in range(1, len(y_steps)):
-    for x_idx in range(1, len(x_steps)):
-      x0 = x_steps[x_idx - 1]
-      y0 = y_steps[y_idx - 1]
-      x1 = x_steps[x_idx]
-      y1 = y_steps[y_idx]
-      roi = face_roi[y0:y1, x0:x1]
-      B, G, R = [int(idx) for idx in cv2.mean(roi)[:3]]
-      cv2.rectangle(face_roi, (x0, y0), (x1, y1), (B, G, R), -1)
-  # Pixelated blurred face_roi
+def pixelate(face_roi: np.ndarray, blocks: int = 7) -> np.ndarray:
+  """Pixelate the region in place using a grid of blocks x blocks cells.
+
+  Region is downscaled to the grid using area interpolation (which is
+  the mean of every cell) & upscaled back using nearest neighbour, so
+  the whole face costs two resizes instead of a call per cell.
+  """
+  height, width = face_roi.shape[:2]
+  if height == 0 or width == 0:
+    return face_roi
+  grid = (max(min(blocks, width), 1), max(min(blocks, height), 1))
+  small = cv2.resize(face_roi, grid, interpolation=cv2.INTER_AREA)
+  face_roi[...] = cv2.resize(small, (width, height),
+                             interpolation=cv2.INTER_NEAREST)
   return face_roi
 
 
+def pixelate_boxes(frame: np.ndarray,
+                   boxes: List[Tuple[int, int, int, int]],
+                   blocks: int = 7) -> np.ndarray:
+  """Pixelate all the regions (x0, y0, x1, y1) of the frame in place."""
+  height, width = frame.shape[:2]
+  for x0, y0, x1, y1 in boxes:
+    x0, y0 = max(int(x0), 0), max(int(y0), 0)
+    x1, y1 = min(int(x1), width), min(int(y1), height)
+    if x1 > x0 and y1 > y0:
+      pixelate(frame[y0:y1, x0:x1], blocks)
+  return frame
+
+
+def detect_faces(frame: np.ndarray,
+                 use_ml_model: bool = True,
+                 confidence: float = 0.75,
+                 backend: Optional[str] = None
+                 ) -> List[Tuple[int, int, int, int]]:
+  """Returns bounding boxes (x0, y0, x1, y1) of the faces in the frame.
+
+  Args:
+    frame: Numpy array of the BGR image frame.
+    use_ml_model: Boolean (default: True) value to use MTCNN instead of
+                  Haar cascade.
+    confidence: Minimum confidence (default: 0.75) of the detections.
+    backend: Detector (default: None -> as per `use_ml_model`) to be
+             used, either `mtcnn`, `dnn` or `haar`.
+
+  Returns:
+    List of bounding boxes of the detected faces.
+  """
+  if backend is None:
+    backend = 'mtcnn' if use_ml_model else 'haar'
+  return get_detector(backend).detect(frame, confidence)
+
+
+def detect_faces_batch(frames: List[np.ndarray],
+                       use_ml_model: bool = True,
+                       confidence: float = 0.75,
+                       backend: Optional[str] = None
+                       ) -> List[List[Tuple[int, int, int, int]]]:
+  """Returns bounding boxes of the faces for every frame in the batch.
+
+  Args:
+    frames: List of numpy arrays of the BGR image frames.
+    use_ml_model: Boolean (default: True) value to use MTCNN instead of
+                  Haar cascade.
+    confidence: Minimum confidence (default: 0.75) of the detections.
+    backend: Detector (default: None -> as per `use_ml_model`) to be
+             used, either `mtcnn`, `dnn` or `haar`.
+
+  Returns:
+    List of bounding boxes of the detected faces, in order of frames.
+  """
+  if backend is None:
+    backend = 'mtcnn' if use_ml_model else 'haar'
+  return get_detector(backend).detect_batch(frames, confidence)
+
+
+def redact_region(frame: np.ndarray,
+                  box: Tuple[int, int, int, int],
+                  smooth_blur: bool = True,
+                  blocks: int = 7) -> None:
+  """Blur or pixelate the region (x0, y0, x1, y1) of the frame in place."""
+  redact_regions(frame, [box], smooth_blur, blocks)
+
+
+def redact_regions(frame: np.ndarray,
+                   boxes: List[Tuple[int, int, int, int]],
+                   smooth_blur: bool = True,
+                   blocks: int = 7) -> None:
+  """Blur or pixelate all the regions (x0, y0, x1, y1) of the frame."""
+  if not smooth_blur:
+    pixelate_boxes(frame, boxes, blocks)
+    return
+  height, width = frame.shape[:2]
+  for x0, y0, x1, y1 in boxes:
+    x0, y0 = max(int(x0), 0), max(int(y0), 0)
+    x1, y1 = min(int(x1), width), min(int(y1), height)
+    if x1 > x0 and y1 > y0:
+      frame[y0:y1, x0:x1] = cv2.GaussianBlur(frame[y0:y1, x0:x1], (21, 21), 0)
+
+
 def redact_faces(file: str,
                  use_ml_model: bool = True,
                  smooth_blur: bool = True,
                  resize: bool = True,
                  resize_width: int = 640,
                  debug_mode: bool = True,
+                 frame_source: str = 'opencv',
+                 backend: Optional[str] = None,
+                 batch_size: int = 1,
+                 track_interval: int = 1,
+                 blocks: int = 7,
+                 workers: int = 1,
+                 use_cache: bool = False,
+                 gate_threshold: Optional[float] = None,
                  log: logging.Logger = None) -> Optional[str]:
-  """Apply face redaction in video using CaffeModel."""
+  """Apply face redaction in video using CaffeModel.
+
+  With `batch_size` above 1, frames are collected into batches & the
+  detector runs once per batch instead of once per frame. With
+  `track_interval` above 1, the detector runs on every Nth frame (or on
+  scene changes & lost tracks) & the faces are tracked in between.
+  Pixelated faces are made of `blocks` x `blocks` cells. With `workers`
+  above 1, frames are detected & redacted by as many processes & written
+  back in order, batching & tracking then don't apply. With `use_cache`,
+  detections are stored per video content & detector configuration, so
+  re-rendering the same video with other blur settings skips detection.
+  It's opt-in as keying the cache reads the whole video once.
+  With `gate_threshold`, frames which barely differ from the last detected
+  frame reuse it's detections & only the changed tiles are detected.
+  """
   log = _log(__file__) if log is None else log
 
-  x0, y0, x1, y1 = 0, 0, 0, 0
-  boxes, temp_csv_entries = [], []
+  temp_csv_entries = []
   face_count = {}
 
   directory = os.path.join(os.path.dirname(file), f'{Path(file).stem}')
@@ -69,104 +168,135 @@ def redact_faces(file: str,
   log.info(f'Redacting faces from "{os.path.basename(file)}".')
 
   try:
-    stream = cv2.VideoCapture(file)
-    fps = stream.get(cv2.CAP_PROP_FPS)
-    width, height = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                     int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-
-    if resize:
-      width, height = resize_width, int(height * (resize_width / float(width)))
-
-    save = cv2.VideoWriter(filename(temp_file, 1),
-                           cv2.VideoWriter_fourcc(*'mp4v'), fps,
-                           (width, height))
-
-    while True:
-      valid_frame, frame = stream.read()
-
-      if not valid_frame:
-        break
-
-      if frame is None:
-        break
-
-      if resize:
-        frame = rescale(frame, resize_width)
-
-      height, width = frame.shape[:2]
-
-      if use_ml_model:
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        faces = face_detector.detect_faces(rgb)
-
-        for face_idx in faces:
-            # Considering detections which have confidence score higher than the
-            # set threshold.
-          if face_idx['confidence'] > 0.75:
-            x0, y0, x1, y1 = face_idx['box']
-            x0, y0 = abs(x0), abs(y0)
-            x1, y1 = x0 + x1, y0 + y1
-
-            face = frame[y0:y1, x0:x1]
-
-            if debug_mode:
-              draw_bounding_box(frame, (x0, y0), (x1, y1), color.red)
-            try:
-              if smooth_blur:
-                frame[y0:y1, x0:x1] = cv2.GaussianBlur(frame[y0:y1, x0:x1],
-                                                       (21, 21), 0)
-              else:
-                frame[y0:y1, x0:x1] = pixelate(face)
-            except Exception:
-              pass
-
-          boxes.append([x1, y1])
-          face_occurence = s2d(int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
-
-          if face_occurence not in face_count.keys():
-            face_count[face_occurence] = []
-
-          face_count[face_occurence].append(len(boxes))
+    batch_size = max(int(batch_size), 1)
+    # Every frame of the batch must stay valid till the batch is written.
+    source = open_source(file, frame_source, resize, resize_width,
+                         ring_size=batch_size + 1)
+    fps, width, height = source.fps, source.width, source.height
+
+    # Frames are encoded straight into browser friendly H264.
+    save = FFmpegWriter(temp_file, fps, (width, height))
+
+    if workers > 1:
+      track_interval, gate_threshold = 1, None
+
+    cache, cache_key, cached = None, None, None
+    if use_cache:
+      cache = FaceCache()
+      # Only the settings affecting the boxes are part of the key, blur &
+      # pixelation settings are free to change between the renders.
+      cache_key = cache.key(file,
+                            backend=backend or ('mtcnn' if use_ml_model
+                                                else 'haar'),
+                            resize=resize, resize_width=resize_width,
+                            frame_source=frame_source,
+                            track_interval=track_interval,
+                            gate_threshold=gate_threshold)
+      cached = cache.load(cache_key)
+      if cached is not None:
+        log.info('Re-using cached face detections.')
+
+    # Bounding boxes of every frame, in order, to be cached.
+    detected = []
+    completed = True
+
+    def detect(frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
+      return detect_faces(frame, use_ml_model, backend=backend)
+
+    gate = None
+    if gate_threshold and cached is None:
+      gate = DifferenceGate(detect, gate_threshold)
+      detect = gate.process
+
+    tracker = None
+    if track_interval > 1 and cached is None:
+      tracker = FaceTracker(detect, track_interval)
+
+    def redact_batch(batch: List[Tuple[float, np.ndarray]]) -> bool:
+      if cached is not None:
+        detections = cached[len(detected):len(detected) + len(batch)]
+        if len(detections) < len(batch):
+          detections += detect_faces_batch(
+              [frame for _, frame in batch[len(detections):]],
+              use_ml_model, backend=backend)
+      elif tracker is not None:
+        detections = [tracker.process(frame) for _, frame in batch]
+      elif gate is not None:
+        detections = [gate.process(frame) for _, frame in batch]
       else:
-        face_cascade = cv2.CascadeClassifier(frontal_haar)
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray_frame, 1.3, 5)
-
-        for (x0, y0, x1, y1) in faces:
-          if debug_mode:
-            draw_bounding_box(frame, (x0, y0), (x0 + x1, y0 + y1), color.red)
-          try:
-            if smooth_blur:
-              frame[y0:(y0 + y1),
-                    x0:(x0 + x1)] = cv2.GaussianBlur(frame[y0:(y0 + y1),
-                                                           x0:(x0 + x1)],
-                                                     (21, 21), 0)
-            else:
-              frame[y0:(y0 + y1),
-                    x0:(x0 + x1)] = pixelate(frame[y0:(y0 + y1), x0:(x0 + x1)])
-          except Exception:
-            pass
-          boxes.append([x1, y1])
-          face_occurence = s2d(int(stream.get(cv2.CAP_PROP_POS_MSEC) / 1000))
+        detections = detect_faces_batch([frame for _, frame in batch],
+                                        use_ml_model, backend=backend)
+      for (position, frame), faces in zip(batch, detections):
+        detected.append(faces)
+        if debug_mode:
+          for box in faces:
+            draw_bounding_box(frame, box[:2], box[2:], color.red)
+        redact_regions(frame, faces, smooth_blur, blocks)
+
+        if faces:
+          face_occurence = s2d(int(position))
 
           if face_occurence not in face_count.keys():
             face_count[face_occurence] = []
 
-          face_count[face_occurence].append(len(boxes))
-
-      boxes = []
-      save.write(frame)
-
-      if debug_mode:
-        cv2.imshow('Video Processing Engine - Redaction', frame)
+          face_count[face_occurence].append(len(faces))
+
+        save.write(frame)
+
+        if debug_mode:
+          cv2.imshow('Video Processing Engine - Redaction', frame)
+
+        if cv2.waitKey(1) & 0xFF == int(27):
+          return False
+      return True
+
+    if workers > 1 and cached is None:
+      # Imported here as the workers import this module in turn.
+      from video_processing_engine.core.redact.parallel import redact_ordered
+      log.info(f'Redacting faces using {workers} processes.')
+      for position, frame, faces in redact_ordered(
+              source, (height, width, 3), workers, use_ml_model, backend,
+              smooth_blur, blocks, debug_mode):
+        detected.append(faces)
+        if faces:
+          face_count.setdefault(s2d(int(position)), []).append(len(faces))
+
+        save.write(frame)
+
+        if debug_mode:
+          cv2.imshow('Video Processing Engine - Redaction', frame)
+
+        if cv2.waitKey(1) & 0xFF == int(27):
+          completed = False
+          break
+    else:
+      batch = []
+      for position, frame in source:
+        batch.append((position, frame))
+        if len(batch) == batch_size:
+          if not redact_batch(batch):
+            batch = []
+            completed = False
+            break
+          batch = []
+
+      if batch and not redact_batch(batch):
+        completed = False
+
+    if tracker is not None:
+      log.info(f'Detector ran on {tracker.detections}/{tracker.frames} '
+               'frames.')
+
+    if gate is not None:
+      log.info(f'Gate skipped {gate.skipped}/{gate.frames} frames & '
+               f'detected changed tiles only on {gate.partial} frames.')
 
-      if cv2.waitKey(1) & 0xFF == int(27):
-        break
-
-    stream.release()
     save.release()
     cv2.destroyAllWindows()
 
+    if cache is not None and cached is None and completed:
+      cache.save(cache_key, detected)
+
     with open(os.path.join(directory, f'{Path(file).stem}.csv'), 'a',
               encoding=dev.DEF_CHARSET) as csv_file:
       log.info('Logging detections into a CSV file.')
@@ -175,10 +305,6 @@ def redact_faces(file: str,
       temp_csv_entries = [(max(v), k) for k, v in face_count.items()]
       _file.writerows(temp_csv_entries)
 
-    log.info('Applying H264 encoding for bypassing browser issues.')
-    os.system(f'ffmpeg -loglevel error -y -i {filename(temp_file, 1)} -vcodec '
-              f'libx264 {temp_file}')
-
     return temp_file
   except Exception as error:
     log.critical(f'Something went wrong because of {error}')
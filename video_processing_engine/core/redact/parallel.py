@@ -0,0 +1,178 @@
+"""A subservice for redacting faces using multiple processes."""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+from multiprocessing import shared_memory
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from video_processing_engine.core.redact.faces import (detect_faces,
+                                                        redact_regions)
+from video_processing_engine.utils.opencvapi import draw_bounding_box
+from video_processing_engine.vars import color
+
+
+def _redact_worker(name: str,
+                   shape: Tuple[int, ...],
+                   tasks: mp.Queue,
+                   done: mp.Queue,
+                   use_ml_model: bool,
+                   backend: Optional[str],
+                   smooth_blur: bool,
+                   blocks: int,
+                   debug_mode: bool) -> None:
+  """Redact faces of the frames in the shared slots until told to stop."""
+  memory = shared_memory.SharedMemory(name=name)
+  slots = np.ndarray(shape, np.uint8, buffer=memory.buf)
+  frame = None
+  try:
+    while True:
+      task = tasks.get()
+      if task is None:
+        break
+      seq, slot, position = task
+      frame = slots[slot]
+      try:
+        faces = detect_faces(frame, use_ml_model, backend=backend)
+        if debug_mode:
+          for box in faces:
+            draw_bounding_box(frame, box[:2], box[2:], color.red)
+        redact_regions(frame, faces, smooth_blur, blocks)
+        done.put((seq, slot, position, faces))
+      except Exception as error:
+        # An unredacted frame must never reach the encoder.
+        done.put((seq, slot, position, f'{type(error).__name__}: {error}'))
+  finally:
+    del slots, frame
+    memory.close()
+    done.put(None)
+
+
+def redact_ordered(source: Iterable[Tuple[float, np.ndarray]],
+                   shape: Tuple[int, ...],
+                   workers: Optional[int] = None,
+                   use_ml_model: bool = True,
+                   backend: Optional[str] = None,
+                   smooth_blur: bool = True,
+                   blocks: int = 7,
+                   debug_mode: bool = False,
+                   depth: Optional[int] = None
+                   ) -> Iterator[Tuple[float, np.ndarray, List[Tuple]]]:
+  """Yields redacted frames in presentation order using worker processes.
+
+  A decoder thread copies every frame into a free slot of a shared memory
+  buffer & hands the slot number to the workers, which detect & redact
+  the faces in place. Finished slots are put back in order through a
+  reorder buffer. Slots are only recycled once their frame is yielded,
+  so the decoder blocks as soon as all the `depth` slots are in flight &
+  memory stays fixed regardless of the speed of the consumer.
+
+  Args:
+    source: Frame source yielding position (in secs) & BGR frame.
+    shape: Shape of the frames of the source.
+    workers: Number of processes (default: None -> all cores) to use.
+    use_ml_model: Boolean (default: True) value to use MTCNN instead of
+                  Haar cascade.
+    backend: Detector (default: None -> as per `use_ml_model`) to be
+             used, either `mtcnn`, `dnn` or `haar`.
+    smooth_blur: Boolean (default: True) value to blur instead of
+                 pixelating the faces.
+    blocks: Cells (default: 7) per side of the pixelated faces.
+    debug_mode: Boolean (default: False) value to draw the detections.
+    depth: Number of frames (default: None -> 2 per worker) in flight.
+
+  Yields:
+    Position (in secs), redacted frame & bounding boxes of it's faces.
+    Frame is a view of the shared buffer valid until the next iteration.
+  """
+  workers = max(int(workers or os.cpu_count() or 1), 1)
+  depth = max(int(depth or 2 * workers), workers + 1)
+  shape = (depth,) + tuple(shape)
+  memory = shared_memory.SharedMemory(create=True,
+                                      size=int(np.prod(shape)))
+  slots = np.ndarray(shape, np.uint8, buffer=memory.buf)
+  # Spawned workers neither inherit the encoder's pipe (which would keep
+  # it open after release) nor the decoder's threads.
+  context = mp.get_context('spawn')
+  tasks, done = context.Queue(), context.Queue()
+  free = queue.Queue()
+  for slot in range(depth):
+    free.put(slot)
+  stop = threading.Event()
+  failures = []
+
+  def decode() -> None:
+    try:
+      for seq, (position, frame) in enumerate(source):
+        slot = free.get()
+        if stop.is_set():
+          break
+        np.copyto(slots[slot], frame)
+        tasks.put((seq, slot, position))
+    except Exception as error:
+      failures.append(f'{type(error).__name__}: {error}')
+    finally:
+      for _ in range(workers):
+        tasks.put(None)
+
+  processes = [context.Process(target=_redact_worker,
+                               args=(memory.name, shape, tasks, done,
+                                     use_ml_model, backend, smooth_blur,
+                                     blocks, debug_mode), daemon=True)
+               for _ in range(workers)]
+  for process in processes:
+    process.start()
+  decoder = threading.Thread(target=decode, daemon=True)
+  decoder.start()
+
+  pending = {}
+  upcoming, running = 0, workers
+  try:
+    while running:
+      try:
+        message = done.get(timeout=1.0)
+      except queue.Empty:
+        if not any(process.is_alive() for process in processes):
+          raise RuntimeError('Redaction workers exited unexpectedly.')
+        continue
+      if message is None:
+        running -= 1
+        continue
+      seq, slot, position, faces = message
+      if isinstance(faces, str):
+        raise RuntimeError(faces)
+      pending[seq] = (slot, position, faces)
+      while upcoming in pending:
+        slot, position, faces = pending.pop(upcoming)
+        yield position, slots[slot], faces
+        free.put(slot)
+        upcoming += 1
+    if failures:
+      raise RuntimeError(failures[0])
+  finally:
+    # Consumer stopped early or a frame failed, release the decoder &
+    # let the workers run out of tasks before tearing down the buffer.
+    stop.set()
+    for slot in range(depth):
+      free.put(slot)
+    decoder.join()
+    while running and any(process.is_alive() for process in processes):
+      try:
+        running -= done.get(timeout=1.0) is None
+      except queue.Empty:
+        continue
+    for process in processes:
+      process.join(timeout=5.0)
+      if process.is_alive():
+        process.terminate()
+    del slots
+    try:
+      memory.close()
+    except BufferError:
+      # Consumer still holds a view of the last frame, the segment is
+      # unmapped once it's gone.
+      pass
+    memory.unlink()
@@ -0,0 +1,248 @@
+"""A subservice for tracking faces in between the detections."""
+
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from video_processing_engine.core.redact.detectors import Detection, score
+
+# Bounding box (x0, y0, x1, y1) of a face.
+Box = Tuple[int, int, int, int]
+
+
+def inflate(box: Box, shape: Tuple[int, ...], margin: float) -> Box:
+  """Returns box grown by the margin (fraction of it's size) on all sides."""
+  height, width = shape[:2]
+  x0, y0, x1, y1 = box
+  dx, dy = (x1 - x0) * margin, (y1 - y0) * margin
+  return Detection((int(max(x0 - dx, 0)), int(max(y0 - dy, 0)),
+                    int(min(x1 + dx, width)), int(min(y1 + dy, height))),
+                   score(box))
+
+
+class FaceTracker(object):
+  """Runs the face detector sparsely & tracks the faces in between.
+
+  The detector runs on every `interval`th frame, on scene changes & as
+  soon as any tracked face is lost. On rest of the frames, corners found
+  inside every face are followed using Lucas-Kanade optical flow & the
+  box is moved by their median displacement. Tracked boxes are inflated
+  by the `margin` so that the redaction stays on the face even when the
+  track lags behind.
+
+  Args:
+    detect: Callable returning bounding boxes of the faces in a frame.
+    interval: Run detector (default: every 5th frame) at least this often.
+    margin: Fraction (default: 0.15) of the box size added on all sides
+            of the tracked boxes.
+    scene_threshold: Mean difference (default: 30) of the thumbnails of
+                     consecutive frames considered a scene change.
+    min_points: Minimum points (default: 4) a face must keep to be
+                considered tracked.
+  """
+
+  def __init__(self,
+               detect: Callable[[np.ndarray], List[Box]],
+               interval: int = 5,
+               margin: float = 0.15,
+               scene_threshold: float = 30.0,
+               min_points: int = 4) -> None:
+    super(FaceTracker, self).__init__()
+    self.detect = detect
+    self.interval = max(int(interval), 1)
+    self.margin = margin
+    self.scene_threshold = scene_threshold
+    self.min_points = min_points
+    self.previous = None
+    self.thumbnail = None
+    self.tracks: List[Tuple[Box, np.ndarray]] = []
+    self.since_detection = 0
+    self.frames = 0
+    self.detections = 0
+
+  def _scene_changed(self, gray: np.ndarray) -> bool:
+    thumbnail = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    changed = (self.thumbnail is not None and
+               cv2.absdiff(thumbnail, self.thumbnail).mean() >
+               self.scene_threshold)
+    self.thumbnail = thumbnail
+    return changed
+
+  def _points(self, gray: np.ndarray, box: Box) -> Optional[np.ndarray]:
+    """Returns corners to be tracked inside the box."""
+    x0, y0, x1, y1 = box
+    mask = np.zeros_like(gray)
+    mask[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = 255
+    return cv2.goodFeaturesToTrack(gray, 30, 0.01, 3, mask=mask)
+
+  def _redetect(self, frame: np.ndarray, gray: np.ndarray) -> List[Box]:
+    boxes = self.detect(frame)
+    self.detections += 1
+    self.since_detection = 0
+    self.tracks = [(box, self._points(gray, box)) for box in boxes]
+    return boxes
+
+  def _track(self, gray: np.ndarray) -> Optional[List[Box]]:
+    """Returns tracked boxes, None if any of the faces was lost."""
+    tracks, boxes = [], []
+    for box, points in self.tracks:
+      if points is None or len(points) < self.min_points:
+        return None
+      moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous, gray,
+                                                  points, None)
+      if moved is None:
+        return None
+      kept = status.reshape(-1) == 1
+      if np.count_nonzero(kept) < self.min_points:
+        return None
+      dx, dy = np.median((moved - points)[kept].reshape(-1, 2), axis=0)
+      x0, y0, x1, y1 = box
+      # Tracked boxes keep the score of the detection they started from.
+      box = Detection((int(round(x0 + dx)), int(round(y0 + dy)),
+                       int(round(x1 + dx)), int(round(y1 + dy))), score(box))
+      tracks.append((box, moved[kept].reshape(-1, 1, 2)))
+      boxes.append(box)
+    self.tracks = tracks
+    return boxes
+
+  def process(self, frame: np.ndarray) -> List[Box]:
+    """Returns bounding boxes (x0, y0, x1, y1) of the faces in the frame.
+
+    Args:
+      frame: Numpy array of the BGR image frame.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    self.frames += 1
+    self.since_detection += 1
+    boxes = None
+    if (self.previous is not None and
+            not self._scene_changed(gray) and
+            self.since_detection < self.interval):
+      boxes = self._track(gray)
+      if boxes is not None:
+        boxes = [inflate(box, frame.shape, self.margin) for box in boxes]
+    elif self.previous is None:
+      self._scene_changed(gray)
+    if boxes is None:
+      # Lost tracks, scene changes & the interval are all covered by a
+      # fresh detection, so no face goes unredacted.
+      boxes = self._redetect(frame, gray)
+    self.previous = gray
+    return boxes
+
+
+class DifferenceGate(object):
+  """Skips the face detector on frames which haven't changed.
+
+  Every frame is downscaled & compared with the frame the detections
+  were last refreshed on, tile by tile. If no tile differs by more than
+  the `threshold`, previous detections are reused. If only a few tiles
+  changed, the detector runs on the region covering them (padded by a
+  tile) & the faces outside of it are kept. Rest of the frames are
+  detected in full. Like the tracked boxes, reused boxes are inflated by
+  the `margin` to cover faces drifting below the threshold, & the whole
+  frame is detected again after `max_skips` frames without a full
+  detection.
+
+  Args:
+    detect: Callable returning bounding boxes of the faces in a frame.
+    threshold: Mean absolute difference (default: 4 gray levels) of a
+               tile considered a change.
+    tiles: Number of tiles (default: 8) per side of the frame.
+    max_changed: Fraction (default: 0.5) of changed tiles above which the
+                 whole frame is detected.
+    width: Width (default: 160 pixels) of the compared thumbnails.
+    margin: Fraction (default: 0.15) of the box size added on all sides
+            of the reused boxes.
+    max_skips: Maximum frames (default: 30) between the full detections.
+  """
+
+  def __init__(self,
+               detect: Callable[[np.ndarray], List[Box]],
+               threshold: float = 4.0,
+               tiles: int = 8,
+               max_changed: float = 0.5,
+               width: int = 160,
+               margin: float = 0.15,
+               max_skips: int = 30) -> None:
+    super(DifferenceGate, self).__init__()
+    self.detect = detect
+    self.threshold = threshold
+    self.tiles = max(int(tiles), 1)
+    self.max_changed = max_changed
+    self.width = width
+    self.margin = margin
+    self.max_skips = max(int(max_skips), 1)
+    self.reference = None
+    self.boxes: List[Box] = []
+    self.since_detection = 0
+    self.frames = 0
+    self.skipped = 0
+    self.partial = 0
+
+  def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+    gray = frame
+    if frame.ndim == 3:
+      gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    # Thumbnail is a whole number of tiles so that they can be reshaped.
+    side = self.width // self.tiles * self.tiles
+    height = max(round(side * gray.shape[0] / gray.shape[1] / self.tiles), 1)
+    return cv2.resize(gray, (side, height * self.tiles),
+                      interpolation=cv2.INTER_AREA)
+
+  def _changed_tiles(self, thumbnail: np.ndarray) -> np.ndarray:
+    """Returns boolean grid of the tiles differing from the reference."""
+    rows = thumbnail.shape[0] // self.tiles
+    cols = thumbnail.shape[1] // self.tiles
+    diff = cv2.absdiff(thumbnail, self.reference).astype(np.float32)
+    means = diff.reshape(self.tiles, rows, self.tiles, cols).mean(axis=(1, 3))
+    return means > self.threshold
+
+  def _detect_all(self, frame: np.ndarray, thumbnail: np.ndarray) -> List[Box]:
+    self.boxes = list(self.detect(frame))
+    self.reference = thumbnail
+    self.since_detection = 0
+    return self.boxes
+
+  def process(self, frame: np.ndarray) -> List[Box]:
+    """Returns bounding boxes (x0, y0, x1, y1) of the faces in the frame.
+
+    Args:
+      frame: Numpy array of the BGR image frame.
+    """
+    self.frames += 1
+    self.since_detection += 1
+    thumbnail = self._thumbnail(frame)
+    if (self.reference is None or self.reference.shape != thumbnail.shape or
+            self.since_detection > self.max_skips):
+      return self._detect_all(frame, thumbnail)
+    changed = self._changed_tiles(thumbnail)
+    if not changed.any():
+      self.skipped += 1
+      return [inflate(box, frame.shape, self.margin) for box in self.boxes]
+    if changed.mean() > self.max_changed:
+      return self._detect_all(frame, thumbnail)
+    # Detect only inside the changed tiles, grown by a tile on all sides
+    # so that faces crossing the boundary are seen whole.
+    self.partial += 1
+    height, width = frame.shape[:2]
+    rows, cols = np.nonzero(changed)
+    row0, row1 = max(rows.min() - 1, 0), min(rows.max() + 2, self.tiles)
+    col0, col1 = max(cols.min() - 1, 0), min(cols.max() + 2, self.tiles)
+    x0, x1 = int(col0 * width / self.tiles), int(col1 * width / self.tiles)
+    y0, y1 = int(row0 * height / self.tiles), int(row1 * height / self.tiles)
+    kept = [box for box in self.boxes
+            if box[2] <= x0 or box[0] >= x1 or box[3] <= y0 or box[1] >= y1]
+    found = [Detection((box[0] + x0, box[1] + y0, box[2] + x0, box[3] + y0),
+                       score(box))
+             for box in self.detect(frame[y0:y1, x0:x1])]
+    self.boxes = kept + found
+    # Only the refreshed tiles move the reference, so slow changes in the
+    # rest of the frame keep adding up until they cross the threshold.
+    rows_px = self.reference.shape[0] // self.tiles
+    cols_px = self.reference.shape[1] // self.tiles
+    area = (slice(row0 * rows_px, row1 * rows_px),
+            slice(col0 * cols_px, col1 * cols_px))
+    self.reference[area] = thumbnail[area]
+    return [inflate(box, frame.shape, self.margin) for box in kept] + found
@@ -98,3 +98,39 @@ def create_chibi_dir(camera_name: Union[int, str], path: str = live) -> str:
     if _error.errno != errno.EEXIST:
       raise
   return path
+
+
+def evict_lru(directory: str, max_size: int, extension: str = '.npz') -> int:
+  """Remove least recently used files above the size limit.
+
+  Files are ranked by their modification time, so caches touch their
+  entries whenever they are read. Partially written (`.tmp.`) files are
+  left alone.
+
+  Args:
+    directory: Directory of the cache.
+    max_size: Maximum size (in bytes) of the cache.
+    extension: Extension (default: .npz) of the cached entries.
+
+  Returns:
+    Number of bytes freed.
+  """
+  entries = []
+  for name in os.listdir(directory):
+    if name.endswith(extension) and '.tmp.' not in name:
+      try:
+        stat = os.stat(os.path.join(directory, name))
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+  total = sum(size for _, size, _ in entries)
+  freed = 0
+  for _, size, name in sorted(entries):
+    if total - freed <= max_size:
+      break
+    try:
+      os.remove(os.path.join(directory, name))
+      freed += size
+    except OSError:
+      continue
+  return freed
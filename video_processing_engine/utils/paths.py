@@ -21,6 +21,10 @@ reference_video = os.path.join(models, md.REFERENCE_VIDEO)
 
 # Path where all the downloaded files are stored.
 downloads = os.path.join(parent_path, 'downloads')
+# Path where the face detections are cached for re-rendering.
+face_cache = os.path.join(downloads, 'face_cache')
+# Path where the keyframe indexes of the videos are cached.
+keyframe_cache = os.path.join(downloads, 'keyframe_cache')
 
 # Other paths
 live = os.path.join(parent_path, 'live')
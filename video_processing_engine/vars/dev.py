@@ -50,3 +50,10 @@ PG_HOST = 'hostname'
 PG_DB_NAME = 'database_name'
 PG_USER = 'admin_user'
 PG_PASSWORD = 'admin_password'
+
+# Maximum size (in bytes) of the cached face detections before the least
+# recently used ones are evicted.
+FACE_CACHE_SIZE = 2 * 1024 ** 3
+
+# Maximum size (in bytes) of the cached keyframe indexes.
+KEYFRAME_CACHE_SIZE = 64 * 1024 ** 2